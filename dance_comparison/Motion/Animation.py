@@ -527,6 +527,10 @@ def positions_global(anim):
     Given an animation compute the global joint
     positions at at every frame
 
+    Only rotations and translations are
+    propagated, joints of the same depth in
+    the hierarchy are processed together.
+
     Parameters
     ----------
 
@@ -541,10 +545,77 @@ def positions_global(anim):
         and joint position J
     """
 
-    positions = transforms_global(anim)[:, :, :, 3]
-    return (
-        positions[:, :, :3] / positions[:, :, 3, np.newaxis]
-    )  # transforms_global(anim)[:,:,3,3] is considered here as a normalizer, but in practice it is 1
+    # Joint-major layout so that gathering a level is contiguous
+    local_rotations = anim.rotations.transforms().transpose(1, 0, 2, 3)
+    local_positions = anim.positions.transpose(1, 0, 2)
+    global_rotations = np.empty(local_rotations.shape)
+    positions = np.empty(local_positions.shape)
+
+    levels = joint_levels(anim.parents)
+    global_rotations[levels[0]] = local_rotations[levels[0]]
+    positions[levels[0]] = local_positions[levels[0]]
+
+    for joints in levels[1:]:
+        parents = anim.parents[joints]
+        parent_rotations = global_rotations[parents]
+        global_rotations[joints] = np.matmul(parent_rotations, local_rotations[joints])
+        positions[joints] = (
+            positions[parents]
+            + np.matmul(parent_rotations, local_positions[joints][..., np.newaxis])[
+                ..., 0
+            ]
+        )
+
+    return np.ascontiguousarray(positions.transpose(1, 0, 2))
+
+
+def joint_depths(parents):
+    """
+    Joint Depths
+
+    Parameters
+    ----------
+
+    parents : (J) ndarray
+        Joint parents, -1 for roots
+
+    Returns
+    -------
+
+    depths : (J) ndarray
+        Number of ancestors of each joint
+    """
+
+    parents = np.asarray(parents)
+    depths = np.zeros(len(parents), dtype=int)
+    ancestors = parents.copy()
+    while np.any(ancestors != -1):
+        has_ancestor = ancestors != -1
+        depths[has_ancestor] += 1
+        ancestors[has_ancestor] = parents[ancestors[has_ancestor]]
+    return depths
+
+
+def joint_levels(parents):
+    """
+    Joint Levels
+
+    Parameters
+    ----------
+
+    parents : (J) ndarray
+        Joint parents, -1 for roots
+
+    Returns
+    -------
+
+    levels : [ndarray]
+        Indices of the joints at each depth
+        of the hierarchy, from the roots
+    """
+
+    depths = joint_depths(parents)
+    return [np.where(depths == d)[0] for d in range(depths.max() + 1)]
 
 
 """ Rotations """
@@ -31,7 +31,7 @@ ordermap = {
 }
 
 
-def load(filename, start=None, end=None, order=None, world=True):
+def load(filename, start=None, end=None, order=None, world=True, fast=False):
     """
     Reads a BVH file and constructs an animation
 
@@ -55,6 +55,11 @@ def load(filename, start=None, end=None, order=None, world=True):
         together in world space rather than local
         space
 
+    fast : bool
+        If set to true the MOTION block is parsed
+        in a single bulk call instead of line by
+        line. The result is the same.
+
     Returns
     -------
 
@@ -176,6 +181,13 @@ def load(filename, start=None, end=None, order=None, world=True):
         fmatch = re.match("\s*Frame Time:\s+([\d\.]+)", line)
         if fmatch:
             frametime = float(fmatch.group(1))
+            N = len(parents) - len(end_site_joints)
+            non_end_site_joints = np.setdiff1d(np.arange(len(parents)), end_site_joints)
+            if fast:
+                _load_motion_block(
+                    f, positions, rotations, channels, non_end_site_joints, start, end
+                )
+                break
             continue
 
         if (start and end) and (i < start or i >= end - 1):
@@ -185,8 +197,6 @@ def load(filename, start=None, end=None, order=None, world=True):
         dmatch = line.strip().split(" ")
         if dmatch:
             data_block = np.array(list(map(float, dmatch)))
-            N = len(parents) - len(end_site_joints)
-            non_end_site_joints = list(set(range(len(parents))) - set(end_site_joints))
             fi = i - start if start else i
             if channels == 3:
                 positions[fi, 0:1] = data_block[0:3]
@@ -220,6 +230,57 @@ def load(filename, start=None, end=None, order=None, world=True):
     )
 
 
+def _load_motion_block(f, positions, rotations, channels, joints, start, end):
+    """
+    Reads all remaining MOTION lines of an opened BVH file at once
+
+    Parameters
+    ----------
+    f : file
+        Opened BVH file, positioned after the
+        'Frame Time' line
+
+    positions : (F, J, 3) ndarray
+        Preallocated positions, filled in place
+
+    rotations : (F, J, 3) ndarray
+        Preallocated euler rotations, filled in place
+
+    channels : int
+        Number of channels of the non-root joints
+
+    joints : (N) ndarray
+        Indices of the joints that are not end sites
+
+    start, end : int
+        Optional Starting and Ending Frame
+    """
+
+    data = np.fromstring(f.read(), sep=" ")
+    N = len(joints)
+    if channels == 3:
+        data = data.reshape(-1, 3 + N * 3)
+    elif channels == 6:
+        data = data.reshape(-1, N * 6)
+    elif channels == 9:
+        assert False, "need to change code to handle end_site_joints"
+    else:
+        raise Exception("Too many channels! %i" % channels)
+
+    if start and end:
+        data = data[start : end - 1]
+    data = data[: len(positions)]
+    fnum = len(data)
+
+    if channels == 3:
+        positions[:fnum, 0] = data[:, 0:3]
+        rotations[:fnum, joints] = data[:, 3:].reshape(fnum, N, 3)
+    else:
+        data = data.reshape(fnum, N, 6)
+        positions[:fnum, joints] = data[:, :, 0:3]
+        rotations[:fnum, joints] = data[:, :, 3:6]
+
+
 def save(
     filename: str,
     anim: Animation,
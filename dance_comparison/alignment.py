@@ -0,0 +1,101 @@
+# Online alignment of a spectator's frames with the reference choreography
+import numpy as np
+
+
+class OnlineAligner:
+    """
+    Streaming dynamic time warping against a reference sequence.
+
+    Each incoming frame advances the accumulated cost by one row, restricted to
+    a Sakoe-Chiba band around the current position estimate, so a frame costs
+    O(band) whatever the length of the reference. The reference may stay on a
+    frame or advance by one or two frames per spectator frame (steps (1, 0),
+    (1, 1) and (1, 2)), which allows spectators up to twice slower or faster.
+
+    Spectator frames may be missing (dropped by the ingest worker, lost by UDP).
+    The frame counter tells how many were skipped since the previous call: after
+    a gap of `delta` frames, the band is centred `delta` frames further and the
+    reference may advance by up to 2 * `delta` frames. After a gap wider than
+    the band, or when the frame counter goes backward (Unreal restarts it at
+    the end of a dance), the alignment restarts around the frame counter.
+
+    The alignment is open-begin (it starts anywhere in the band around the first
+    hint) and open-end: the estimated reference position is the end of the
+    cheapest path so far. Every path has one step per spectator frame, so their
+    costs are comparable without normalization.
+    """
+
+    def __init__(self, ref_features, band=60):
+        """
+        Parameters:
+            ref_features (np.ndarray): Reference frames of shape (n_frames, n_joints, d),
+                                       e.g. the normalized 2D skeletons.
+            band (int): Half-width of the band of reference frames around the
+                        expected position.
+        """
+        self.ref_features = np.ascontiguousarray(ref_features, dtype=np.float32)
+        self.band = band
+        # Accumulated cost of the last row, with leading infinite values so that
+        # j - step never wraps around, steps go up to twice the band
+        self._pad = 2 * band + 2
+        self._cost = np.full(len(self.ref_features) + self._pad, np.inf)
+        self._band_start, self._band_end = 0, 0
+        self._hint = None
+        self.position = None
+
+    def reset(self):
+        """Forget the past frames, e.g. when the spectator's frame counter restarts."""
+        self._cost[self._band_start + self._pad : self._band_end + self._pad] = np.inf
+        self._band_start, self._band_end = 0, 0
+        self._hint = None
+        self.position = None
+
+    def update(self, frame, hint=0):
+        """
+        Align a new spectator frame.
+
+        Parameters:
+            frame (np.ndarray): Spectator frame of shape (n_joints, d).
+            hint (int): Expected reference frame (the frame counter), places the
+                        band of the first frame, then gives the number of
+                        spectator frames since the previous call. A counter
+                        going backward restarts the alignment.
+
+        Returns:
+            int: Estimated reference frame of the spectator frame.
+        """
+        if self._hint is not None and not 0 <= hint - self._hint <= self.band:
+            # New dance, or too many frames were missed for the band to follow
+            self.reset()
+        delta = 1 if self._hint is None else max(hint - self._hint, 1)
+        self._hint = hint
+
+        n_frames = len(self.ref_features)
+        center = hint if self.position is None else self.position + delta
+        start = min(max(center - self.band, 0), n_frames - 1)
+        end = min(max(center + self.band + 1, start + 1), n_frames)
+
+        # Mean distance between the joints of the frame and of each reference frame
+        diff = self.ref_features[start:end] - np.asarray(frame, dtype=np.float32)
+        distances = np.sqrt(np.einsum("bjk,bjk->bj", diff, diff)).mean(axis=1)
+
+        if not np.all(np.isfinite(distances)):
+            raise ValueError("The frame contains invalid coordinates.")
+
+        cost, pad = self._cost, self._pad
+        if self.position is not None:
+            # Cost at j comes from j (stay) to j - 2 * delta in the previous row,
+            # the band always contains position + delta so a path exists
+            previous = cost[start + pad : end + pad].copy()
+            for step in range(1, 2 * delta + 1):
+                shifted = cost[start + pad - step : end + pad - step]
+                np.minimum(previous, shifted, out=previous)
+            distances += previous
+        lowest = distances.min()
+
+        # Only the new band is kept, the cost is shifted so that it stays bounded
+        cost[self._band_start + pad : self._band_end + pad] = np.inf
+        cost[start + pad : end + pad] = distances - lowest
+        self._band_start, self._band_end = start, end
+        self.position = start + int(np.argmin(distances))
+        return self.position
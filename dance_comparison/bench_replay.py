@@ -0,0 +1,277 @@
+"""
+Replay a recorded session or a BVH file as OSC /data packets against the scoring
+server and measure throughput, drops and latency, without Unreal.
+
+The server must answer with the frame number (main.py --echo-frame), results are
+received on the port Unreal normally listens on. Usage from the root folder:
+
+    python dance_comparison/bench_replay.py my_motion_data/<run> --rate 60 --spawn-server
+    python dance_comparison/bench_replay.py ./choreography_fixed.bvh --rate 0 --spawn-server \
+        --server-args "--ingest latest"
+    python dance_comparison/bench_replay.py my_motion_data/<run> --blob --server-args=--fast-osc
+    python dance_comparison/bench_replay.py my_motion_data/<run> --shm --rate 0 --spawn-server
+"""
+
+import argparse
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+from pythonosc.osc_message import OscMessage
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from fast_osc import BLOB_ADDRESS, encode_skeleton_blob
+from recorder import load_recording_columns
+from shm_ingest import SHM_NAME, ShmFrameProducer
+from utils import extract_ref_motion_data
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def load_frames(fname):
+    """
+    Load frames to replay as raw 3D skeletons, in the layout sent by Unreal.
+
+    Parameters:
+        fname (str): A recording of `main_recording` (see
+                     `recorder.load_recording_columns`) or a BVH file. The raw
+                     3D frames are replayed if recorded, else the projected 2D
+                     frames with z = 0.
+
+    Returns:
+        np.ndarray: Frames of shape (n_frames, n_joints, 3).
+    """
+    if fname.endswith(".bvh"):
+        frames = np.array(extract_ref_motion_data(fname))
+    else:
+        columns, _ = load_recording_columns(fname)
+        if "raw" in columns:
+            return np.array(columns["raw"], dtype=float)  # Exactly as received
+        recorded = columns["frames"]
+        frames = np.zeros(recorded.shape[:2] + (3,))
+        frames[:, :, :2] = recorded
+    frames[:, :, 0] *= -1  # The server flips the x-axis back
+    return frames
+
+
+def build_packets(frames, address="/data", first_frame_number=0, blob=False):
+    """
+    Encode every frame as an OSC datagram, ahead of time: a /data message with
+    one float per coordinate, or a /datab blob of the same source with `blob`.
+    """
+    packets = []
+    for i, frame in enumerate(frames):
+        if blob:
+            builder = OscMessageBuilder(BLOB_ADDRESS)
+            source = int(address[len("/data") :] or 0)
+            builder.add_arg(
+                encode_skeleton_blob(frame, first_frame_number + i, source),
+                OscMessageBuilder.ARG_TYPE_BLOB,
+            )
+            packets.append(builder.build().dgram)
+            continue
+        builder = OscMessageBuilder(address)
+        for value in frame.ravel():
+            builder.add_arg(float(value), OscMessageBuilder.ARG_TYPE_FLOAT)
+        for _ in range(3):
+            builder.add_arg(0.0, OscMessageBuilder.ARG_TYPE_FLOAT)
+        builder.add_arg(float(first_frame_number + i), OscMessageBuilder.ARG_TYPE_FLOAT)
+        packets.append(builder.build().dgram)
+    return packets
+
+
+class ResultsReceiver:
+    """Stand-in for Unreal, timestamps the /results and keeps other answers."""
+
+    def __init__(self, ip, port):
+        self.receive_times = {}
+        self.answers = {}
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((ip, port))
+        self._socket.settimeout(0.1)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            try:
+                data = self._socket.recv(65536)
+            except socket.timeout:
+                continue
+            now = time.perf_counter()
+            try:
+                message = OscMessage(data)
+            except Exception:
+                continue
+            if message.address.startswith("/results") and len(message.params) > 1:
+                self.receive_times.setdefault(int(message.params[1]), now)
+            else:
+                self.answers[message.address] = message.params
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close()
+
+
+def replay(packets, ip, port, rate):
+    """Send the packets at `rate` Hz (0 for flat-out), return their send times."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    send_times = np.zeros(len(packets))
+    start = time.perf_counter()
+    for i, packet in enumerate(packets):
+        if rate > 0:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        send_times[i] = time.perf_counter()
+        sock.sendto(packet, (ip, port))
+    sock.close()
+    return send_times
+
+
+def replay_shm(frames, first_frame_number, rate, name=SHM_NAME, source=0):
+    """
+    Write the raw frames to the shared-memory ring of the server at `rate` Hz
+    (0 for flat-out), return their send times.
+    """
+    producer = ShmFrameProducer(name)
+    send_times = np.zeros(len(frames))
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        if rate > 0:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        send_times[i] = time.perf_counter()
+        producer.send(frame, first_frame_number + i, source)
+    producer.close()
+    return send_times
+
+
+def spawn_server(server_args):
+    """Start main.py from the root folder and wait until it listens."""
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--echo-frame", *server_args],
+        cwd=os.path.dirname(os.path.dirname(SERVER_SCRIPT)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    for line in process.stdout:
+        if "Server is running" in line:
+            break
+    else:
+        raise RuntimeError("The scoring server exited before listening.")
+    # Keep draining the output so that the server never blocks on prints
+    threading.Thread(target=process.stdout.read, daemon=True).start()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("input", help="Recording or BVH file to replay.")
+    parser.add_argument(
+        "--rate", type=float, default=60, help="Frames per second, 0 for flat-out."
+    )
+    parser.add_argument("--start", type=int, default=0, help="First frame to send.")
+    parser.add_argument("--frames", type=int, help="Number of frames to send.")
+    parser.add_argument("--address", default="/data", help="OSC address of the frames.")
+    parser.add_argument(
+        "--blob",
+        action="store_true",
+        help="Send each frame as a single /datab blob, from the source of --address.",
+    )
+    parser.add_argument(
+        "--shm",
+        action="store_true",
+        help="Write the frames to the shared-memory ring of the server instead of "
+        "sending them over OSC, from the source of --address.",
+    )
+    parser.add_argument(
+        "--shm-name", default=SHM_NAME, help="Name of the shared-memory ring."
+    )
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="Server port.")
+    parser.add_argument(
+        "--client-port", type=int, default=9001, help="Port on which results arrive."
+    )
+    parser.add_argument(
+        "--spawn-server",
+        action="store_true",
+        help="Start main.py --echo-frame locally for the benchmark.",
+    )
+    parser.add_argument(
+        "--server-args", default="", help="Extra arguments for the spawned server."
+    )
+    parser.add_argument(
+        "--drain", type=float, default=1.0, help="Seconds to wait for late results."
+    )
+    args = parser.parse_args()
+
+    frames = load_frames(args.input)
+    end = None if args.frames is None else args.start + args.frames
+    frames = frames[args.start : end]
+    server_args = shlex.split(args.server_args)
+    if args.shm:
+        server_args += ["--ingest-backend", "shm", "--shm-name", args.shm_name]
+    else:
+        packets = build_packets(frames, args.address, args.start, args.blob)
+
+    server = spawn_server(server_args) if args.spawn_server else None
+    receiver = ResultsReceiver(args.ip, args.client_port)
+    try:
+        if args.shm:
+            source = int(args.address[len("/data") :] or 0)
+            send_times = replay_shm(frames, args.start, args.rate, args.shm_name, source)
+        else:
+            send_times = replay(packets, args.ip, args.port, args.rate)
+        time.sleep(args.drain)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(OscMessageBuilder("/dropped").build().dgram, (args.ip, args.port))
+        sock.close()
+        time.sleep(0.2)
+    finally:
+        receiver.close()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    # Results are keyed by frame number, sends by position
+    latencies = np.array(
+        [
+            receive_time - send_times[frame_number - args.start]
+            for frame_number, receive_time in receiver.receive_times.items()
+            if 0 <= frame_number - args.start < len(send_times)
+        ]
+    )
+    duration = send_times[-1] - send_times[0] if len(send_times) > 1 else 0.0
+    print(f"Sent:        {len(send_times)} frames in {duration:.2f}s")
+    if duration > 0:
+        print(f"Send rate:   {len(send_times) / duration:.1f} frames/s")
+    print(f"Answered:    {len(latencies)} frames")
+    print(
+        f"Unanswered:  {100 * (1 - len(latencies) / len(send_times)):.1f}% "
+        "(dropped, stale, erroneous or hands down)"
+    )
+    if len(latencies):
+        # Until the last result, the server may lag behind a flat-out replay
+        results_duration = max(receiver.receive_times.values()) - send_times[0]
+        print(f"Throughput:  {len(latencies) / results_duration:.1f} results/s")
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        print(
+            f"Latency:     p50 {p50:.2f}ms  p95 {p95:.2f}ms  p99 {p99:.2f}ms  "
+            f"max {latencies.max() * 1000:.2f}ms"
+        )
+    if "/dropped" in receiver.answers:
+        print(f"Server:      {receiver.answers['/dropped'][0]}")
+
+
+if __name__ == "__main__":
+    main()
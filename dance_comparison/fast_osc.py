@@ -0,0 +1,139 @@
+# Fast path for the OSC skeleton frames, decoded straight into NumPy buffers
+import asyncio
+
+import numpy as np
+
+BLOB_ADDRESS = "/datab"
+BLOB_HEADER_SIZE = 12  # Frame number, joint count and source id, little-endian int32
+
+
+def encode_skeleton_blob(joints, frame_number, source=0):
+    """
+    Pack a skeleton as the blob of a /datab message: a header of little-endian
+    int32 (frame number, joint count, source id) followed by the joint
+    coordinates as little-endian float32, joint after joint.
+    """
+    joints = np.asarray(joints)
+    header = np.array([frame_number, len(joints), source], dtype="<i4")
+    return header.tobytes() + joints.astype("<f4").tobytes()
+
+
+def decode_skeleton_blob(buffer, offset=0):
+    """
+    Decode a /datab blob without copying the joints, see `encode_skeleton_blob`.
+
+    Parameters:
+        buffer (bytes): Blob, or datagram containing the blob.
+        offset (int): Position of the blob in the buffer.
+
+    Returns:
+        tuple: (source, frame_number, joints), with `joints` a read-only float32
+               view of shape (n_joints, 3) on the buffer.
+    """
+    frame_number, n_joints, source = np.frombuffer(buffer, "<i4", 3, offset).tolist()
+    joints = np.frombuffer(buffer, "<f4", 3 * n_joints, offset + BLOB_HEADER_SIZE)
+    return source, frame_number, joints.reshape(n_joints, 3)
+
+
+def blob_source_address(source):
+    """Address of the /data messages of the same spectator: /data for 0, /data<source> else."""
+    return "/data" if source == 0 else f"/data{source}"
+
+
+def decode_float_message(data, prefix=b"/data"):
+    """
+    Locate the arguments of an OSC message whose address starts with `prefix`
+    and whose arguments are all float32, without decoding them.
+
+    Parameters:
+        data (bytes): OSC datagram.
+        prefix (bytes): Start of the addresses to decode.
+
+    Returns:
+        tuple: (address, offset, count), the address and the position and number
+               of the big-endian float32 arguments, or None for any other
+               datagram (other addresses or types, bundles, truncated data).
+    """
+    if not data.startswith(prefix):
+        return None
+    address_end = data.find(b"\0")
+    # Strings are null-terminated and padded to 4 bytes
+    tags_start = (address_end + 4) & ~3
+    if data[tags_start : tags_start + 1] != b",":
+        return None
+    tags_end = data.find(b"\0", tags_start)
+    count = tags_end - tags_start - 1
+    if count <= 0 or data.count(b"f", tags_start + 1, tags_end) != count:
+        return None
+    offset = (tags_end + 4) & ~3
+    if len(data) < offset + 4 * count:
+        return None
+    return data[:address_end].decode(), offset, count
+
+
+class FastOSCProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol that decodes the float arguments of skeleton frames with
+    a single `np.frombuffer` conversion, instead of creating one Python float per
+    argument. The handler receives the arguments as a new NumPy array with the
+    same layout as the OSC arguments, which it may keep while the frame waits
+    to be scored.
+
+    /datab blobs are decoded in place, the handler receives them with the
+    address of the spectator's /data messages and a (joints, frame_number)
+    pair as arguments, `joints` being a view on the datagram.
+
+    Other datagrams go through the python-osc dispatcher as usual.
+    """
+
+    def __init__(self, dispatcher, handler, prefix="/data"):
+        """
+        Parameters:
+            dispatcher (Dispatcher): Dispatcher of the other datagrams.
+            handler (callable): Called as handler(address, args) for each frame,
+                                with `args` a float64 array.
+            prefix (str): Start of the addresses of the frames.
+        """
+        self.dispatcher = dispatcher
+        self.handler = handler
+        self.prefix = prefix.encode()
+        self.stats = {"decoded": 0, "dispatched": 0}
+        self.transport = None
+
+        # Address, type tag ",b" and blob size, each padded to 4 bytes
+        self._blob_prefix = BLOB_ADDRESS.encode() + b"\0\0,b\0\0"
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, client_address):
+        try:
+            if data.startswith(self._blob_prefix):
+                self._receive_blob(data)
+                return
+
+            decoded = decode_float_message(data, self.prefix)
+            if decoded is None:
+                self.stats["dispatched"] += 1
+                self.dispatcher.call_handlers_for_packet(data, client_address)
+                return
+
+            address, offset, count = decoded
+            # Converted from big-endian while copying, no intermediate objects.
+            # The array is never reused, the frame may wait in the ingest queue
+            args = np.frombuffer(data, dtype=">f4", count=count, offset=offset).astype(
+                np.float64
+            )
+            self.stats["decoded"] += 1
+            self.handler(address, args)
+        except Exception as e:
+            print(f"Error receiving OSC datagram: {e}")
+
+    def _receive_blob(self, data):
+        blob_start = len(self._blob_prefix) + 4
+        blob_size = int.from_bytes(data[len(self._blob_prefix) : blob_start], "big")
+        if len(data) < blob_start + blob_size:
+            raise ValueError("Truncated /datab blob.")
+        source, frame_number, joints = decode_skeleton_blob(data, blob_start)
+        self.stats["decoded"] += 1
+        self.handler(blob_source_address(source), (joints, frame_number))
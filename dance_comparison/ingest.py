@@ -0,0 +1,153 @@
+# Decouple receiving OSC messages from scoring them
+import threading
+from collections import OrderedDict, deque
+
+
+class ScoringWorker:
+    """
+    Score incoming messages in a dedicated thread, so that the OSC event loop
+    only enqueues them and keeps answering.
+
+    Pending messages are held in a bounded queue. When it is full, either the
+    oldest pending message (default) or the incoming one is dropped, which keeps
+    the latency bounded under bursts.
+    """
+
+    def __init__(self, handler, maxsize=4, drop_oldest=True, batch=False):
+        """
+        Parameters:
+            handler (callable): Called as handler(address, *args) for each message.
+            maxsize (int): Maximum number of pending messages.
+            drop_oldest (bool): When the queue is full, drop the oldest pending
+                                message instead of the incoming one.
+            batch (bool): Call handler(messages) once with all the pending
+                          (address, args) messages instead.
+        """
+        if maxsize is not None and maxsize < 1:
+            raise ValueError(f"The queue must hold at least one message, not {maxsize}.")
+        self.handler = handler
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+        self.batch = batch
+        self.stats = {"received": 0, "processed": 0, "dropped": 0}
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def submit(self, address, *args):
+        """Dispatcher handler, enqueue the message without processing it."""
+        self.submit_args(address, args)
+
+    def submit_args(self, address, args):
+        """Enqueue a message whose arguments are given as a sequence (tuple or array)."""
+        with self._condition:
+            self.stats["received"] += 1
+            if self._push(address, args):
+                self._condition.notify()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _push(self, address, args):
+        """Add a message to the pending ones, return False if it was dropped."""
+        if len(self._pending) >= self.maxsize:
+            self.stats["dropped"] += 1
+            if not self.drop_oldest:
+                return False
+            self._pending.popleft()
+        self._pending.append((address, args))
+        return True
+
+    def _pop(self):
+        """Remove and return the next message to process."""
+        return self._pending.popleft()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                if self.batch:
+                    messages = [self._pop() for _ in range(len(self._pending))]
+                else:
+                    messages = [self._pop()]
+
+            try:
+                if self.batch:
+                    self.handler(messages)
+                else:
+                    address, args = messages[0]
+                    self.handler(address, *args)
+            except Exception as e:
+                print(f"Error in scoring worker: {e}")
+            self.stats["processed"] += len(messages)
+
+
+class CoalescingScoringWorker(ScoringWorker):
+    """
+    Scoring worker that only keeps the newest pending frame of each source
+    (OSC address), so that results always reflect the current pose.
+
+    Frames are ordered by their frame number (last OSC argument). A frame older
+    than the pending or last processed one of its source is stale and skipped,
+    unless the counter jumped back by more than `reset_gap` frames, which
+    happens when the sender restarts its count.
+    """
+
+    def __init__(self, handler, reset_gap=30, batch=False):
+        """
+        Parameters:
+            handler (callable): Called as handler(address, *args) for each frame.
+            reset_gap (int): Backward jump of the frame number treated as a reset.
+            batch (bool): Call handler(messages) once with the pending frame of
+                          every source instead.
+        """
+        super().__init__(handler, maxsize=None, batch=batch)
+        self.reset_gap = reset_gap
+        self.stats = {"received": 0, "processed": 0, "superseded": 0, "stale": 0}
+
+        self._pending = OrderedDict()
+        self._last_frames = {}
+
+    def _is_stale(self, frame_number, previous_frame_number):
+        return (
+            previous_frame_number - self.reset_gap
+            < frame_number
+            <= previous_frame_number
+        )
+
+    def _push(self, address, args):
+        frame_number = args[-1]
+        if address in self._pending:
+            previous_frame_number = self._pending[address][-1]
+        else:
+            previous_frame_number = self._last_frames.get(address)
+
+        if previous_frame_number is not None and self._is_stale(
+            frame_number, previous_frame_number
+        ):
+            self.stats["stale"] += 1
+            return False
+
+        if address in self._pending:
+            self.stats["superseded"] += 1
+        self._pending[address] = args
+        return True
+
+    def _pop(self):
+        address, args = self._pending.popitem(last=False)
+        self._last_frames[address] = args[-1]
+        return address, args
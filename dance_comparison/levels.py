@@ -0,0 +1,148 @@
+# Registry of the levels, one per BVH reference of a folder
+import glob
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import extract_ref_motion_data, prune_motion_cache
+
+
+def level_name(fname):
+    """Name of the level of a BVH file: "mutation_dance_fixed.bvh" -> "mutation_dance"."""
+    stem = os.path.splitext(os.path.basename(fname))[0]
+    return stem[: -len("_fixed")] if stem.endswith("_fixed") else stem
+
+
+# Fresh interpreters for the parsing processes: forking a server that runs
+# the OSC loop, the scoring worker and the watcher threads can deadlock
+_POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def _warm_motion_cache(fname):
+    """Parse a BVH file into the motion cache, nothing is sent back to the parent."""
+    extract_ref_motion_data(fname, normalize=True)
+
+
+class LevelRegistry:
+    """
+    Levels discovered from the BVH files of a folder, with the data derived from
+    their reference ready to use.
+
+    At startup, the BVH files are parsed in parallel into the motion cache (see
+    `utils.load_cached_motion_data`) by a process pool and then memory-mapped.
+    A background thread can watch the folder: new or modified references are
+    loaded and prepared in that thread, then swapped in with a single
+    assignment, so lookups never wait and never see a half-built level.
+    """
+
+    def __init__(self, directory=".", prepare=None, poll_interval=2.0):
+        """
+        Parameters:
+            directory (str): Folder of the BVH references.
+            prepare (callable): Called as prepare(name, ref_motion) with the
+                                normalized reference, returns the data of the
+                                level. Defaults to the reference itself.
+            poll_interval (float): Interval at which the folder is checked for
+                                   changes when watching (in seconds).
+        """
+        self.directory = directory
+        self.prepare = prepare if prepare is not None else (lambda name, motion: motion)
+        self.poll_interval = poll_interval
+
+        self._levels = {}
+        self._mtimes = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __contains__(self, name):
+        return name in self._levels
+
+    def get(self, name):
+        """Data of a level, a dictionary lookup."""
+        return self._levels[name]
+
+    @property
+    def names(self):
+        return sorted(self._levels)
+
+    def discover(self):
+        """BVH references of the folder, by level name."""
+        return {
+            level_name(fname): fname
+            for fname in sorted(glob.glob(os.path.join(self.directory, "*.bvh")))
+        }
+
+    def load_all(self, jobs=None):
+        """
+        Load every level of the folder. Files missing from the cache are parsed
+        in parallel, then all of them are memory-mapped from the cache.
+
+        Parameters:
+            jobs (int): Number of processes, defaults to the number of CPUs.
+        """
+        files = self.discover()
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=_POOL_CONTEXT)
+        with executor:
+            futures = {
+                name: executor.submit(_warm_motion_cache, fname)
+                for name, fname in files.items()
+            }
+            for name, future in futures.items():
+                try:
+                    future.result()
+                    self._load(name, files[name])
+                except Exception as e:
+                    print(f"Error loading level {name} from {files[name]}: {e}")
+
+    def reload_changed(self):
+        """Load the new and modified references, return the names of the reloaded levels."""
+        changed = {
+            name: fname
+            for name, fname in self.discover().items()
+            if os.path.getmtime(fname) != self._mtimes.get(name)
+        }
+        if not changed:
+            return []
+
+        # Parse in another process, so that the GIL stays free for the OSC loop
+        reloaded = []
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=_POOL_CONTEXT)
+        with executor:
+            for name, fname in changed.items():
+                mtime = os.path.getmtime(fname)
+                try:
+                    executor.submit(_warm_motion_cache, fname).result()
+                    self._load(name, fname)
+                    reloaded.append(name)
+                except Exception as e:
+                    # Keep the previous version until the file changes again
+                    self._mtimes[name] = mtime
+                    print(f"Error loading level {name} from {fname}: {e}")
+        return reloaded
+
+    def start_watching(self):
+        """Reload changed references from a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            for name in self.reload_changed():
+                print(f"Reloaded level {name}")
+
+    def _load(self, name, fname):
+        mtime = os.path.getmtime(fname)
+        data = self.prepare(name, extract_ref_motion_data(fname, normalize=True))
+        # Swap the whole dictionary, readers see either the old or the new one
+        self._levels = {**self._levels, name: data}
+        self._mtimes[name] = mtime
+        # Entries of the former versions are never read again
+        prune_motion_cache(fname)
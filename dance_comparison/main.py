@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import time
 
@@ -15,12 +16,38 @@ from pythonosc.dispatcher import Dispatcher
 from pythonosc.udp_client import SimpleUDPClient
 from pythonosc.osc_server import AsyncIOOSCUDPServer
 
-from skeleton_utils import normalize_skeleton, JOINTS_NAMES_TO_IDX, PARENTS
-from utils import extract_ref_motion_data, get_orthogonal_indices
+from skeleton_utils import normalize_skeleton, ANGLES, JOINTS_NAMES_TO_IDX, PARENTS
+from utils import (
+    convert_angles_names_to_idx,
+    get_orthogonal_indices,
+)
 from draw_utils import draw_skeleton
-
-# Which axes are front-up etc. CHANGES for the incoming data depending on initialization
-SPECTATOR_XY_AXES = None
+from score import (
+    HANDS_IDX,
+    EnergyTracker,
+    build_angle_windows,
+    build_full_body_scorer,
+    build_hand_windows,
+    compute_angles,
+    compute_energy,
+    compute_reference_angles,
+    hands_close,
+    match_angles,
+    trailing_mean,
+)
+from thresholds import THRESHOLD_PROFILES_DIR, build_thresholds
+from spatial_index import build_hand_grids, hands_close_indexed
+from alignment import OnlineAligner
+from levels import LevelRegistry
+from fast_osc import (
+    BLOB_ADDRESS,
+    FastOSCProtocol,
+    blob_source_address,
+    decode_skeleton_blob,
+)
+from ingest import CoalescingScoringWorker, ScoringWorker
+from shm_ingest import SHM_NAME, ShmFrameConsumer
+from metrics import Metrics
 
 # This should be fixed!
 REFERENCE_XY_AXES = [0, 1]
@@ -30,16 +57,65 @@ OSC_PORT = 8080  # PYTHON SERVER PORT
 OSC_CLIENT_PORT = 9001  # UNREAL PORT
 OSC_IP = "127.0.0.1"
 RESULT_INTERVAL = 1  # Interval at which to send results of the analysis (in seconds)
+ECHO_FRAME_NUMBER = False  # Append the frame number to /results (for benchmarks)
+
+# INGESTION
+# "inline" scores on the OSC loop, "worker" in a dedicated thread, "latest" in a
+# dedicated thread keeping only the newest pending frame of each spectator
+INGEST_MODE = "worker"
+INGEST_QUEUE_SIZE = 4  # Frames waiting to be scored in "worker" mode
+INGEST_DROP_OLDEST = True  # When the queue is full drop the oldest frame, else the newest
+WORKER = None
+DATA_HANDLER = None  # Called as handler(address, args) for each frame, set in main()
+FAST_OSC = False  # Decode the /data frames with NumPy instead of python-osc
+PROTOCOL = None
+# "osc" receives the frames on OSC_PORT, "shm" also reads them from a shared-memory
+# ring written by local capture tools (see shm_ingest.py), OSC keeps /level, /ping...
+INGEST_BACKEND = "osc"
+SHM_SLOTS = 256  # Frames held by the ring, older unread frames are skipped
+SHM_REPLACE = False  # Remove a ring of the same name, left behind by a crashed server
+SHM_POLL_INTERVAL = 0.0001  # Interval at which an empty ring is polled (in seconds)
+CONSUMER = None
+EVENT_LOOP = None  # Loop of the OSC server, set in main()
+
+# METRICS
+STATS_INTERVAL = 5  # Interval at which to send /stats (in seconds)
+METRICS = Metrics(
+    ["parse", "normalize", "project", "align", "window", "distance", "send"],
+    enabled=False,
+)
 
 # DATA ABOUT CURRENT LEVEL
-CURRENT_LEVEL = "choreography"
+CURRENT_LEVEL = "choreography"  # Level of new spectators
 REF_FRAMETIME = 1 / 30  # It should not change!!!!!
-REF_MOTION = None
+LEVELS_DIR = "."  # Folder of the BVH references, one level each (from root folder)
+LEVELS = None  # LevelRegistry, with the data of each level built by `prepare_level`
+WATCH_LEVELS = True  # Reload new and modified references while running
 IDX_TO_LEVEL = {0: "mutation_dance", 1: "choreography"}
 LEVEL_TO_IDX = {"mutation_dance": 0, "choreography": 1}
+THRESHOLD_PROFILES = THRESHOLD_PROFILES_DIR  # Folder of the threshold profiles
+HAND_WINDOW = 30  # Number of past reference frames the hands can match
+SPATIAL_INDEX = False  # Query a grid of the hand trajectories instead of precomputed windows
+
+# ENERGY
+SEND_ENERGY = False  # Send the spectator and reference energies on /energy
+ENERGY_WINDOW = 30  # Number of frames over which the energy is averaged
+
+# FULL BODY
+FULL_BODY = False  # Score the FULL_BODY_JOINTS of score.py instead of the hands only
+SCORER = None
+
+# ALIGNMENT
+ALIGN = False  # Estimate the reference frame with online DTW instead of the frame counter
+ALIGN_BAND = 60  # Half-width of the band of reference frames searched around the estimate
+
+# ANGLES
+SEND_ANGLES = False  # Send the angle matching result and lag on /angles
+ANGLE_INDICES = np.array(convert_angles_names_to_idx(ANGLES))
+ANGLE_TOLERANCE = 30  # In degrees
 
-# History to compute smoothing
-previous_spec_frame = None
+# State of each spectator, by suffix of the /data address ("" for /data, "1" for /data1...)
+SESSIONS = {}
 last_send_time = time.time()
 
 # Client to send OSC messages back to Unreal
@@ -51,10 +127,92 @@ def answer_ping(address, *args):
     client.send_message("/answer", json.dumps("pong"))
 
 
+def answer_dropped(address, *args):
+    stats = WORKER.stats if WORKER is not None else {}
+    client.send_message("/dropped", json.dumps(stats))
+
+
 def load_level(address, *args):
+    """
+    Change the level of every spectator, or of the spectator given as second
+    argument. The level is given by its index in IDX_TO_LEVEL or by its name.
+    """
     global CURRENT_LEVEL
-    CURRENT_LEVEL = IDX_TO_LEVEL[args[0]]
-    print(f"Changed level to {IDX_TO_LEVEL[args[0]]}")
+    level = args[0] if isinstance(args[0], str) else IDX_TO_LEVEL.get(args[0])
+    if level not in LEVELS:
+        print(f"Unknown level {args[0]}, the levels are {LEVELS.names}")
+        return
+    if len(args) > 1:
+        get_session(str(args[1])).level = level
+        print(f"Changed level of spectator {args[1]} to {level}")
+        return
+    CURRENT_LEVEL = level
+    for session in SESSIONS.values():
+        session.level = level
+    print(f"Changed level to {level}")
+
+
+class SpectatorSession:
+    """State of one tracked spectator."""
+
+    def __init__(self, source, level):
+        self.source = source
+        self.level = level
+        # Which axes are front-up etc. CHANGES for the incoming data depending on initialization
+        self.xy_axes = None
+        # History to compute smoothing
+        self.previous_frame = None
+        self.previous_frame_number = None
+        self.energy = EnergyTracker(ENERGY_WINDOW)
+        # Alignment with the reference of the level, created on the first frame
+        self.aligner = None
+        self.aligner_level = None  # Level data the aligner was built for
+
+
+def prepare_level(name, ref_motion):
+    """
+    Precompute everything the scoring needs from the normalized reference of a
+    level, for the options in use.
+
+    Returns:
+        dict: The reference "motion", its "thresholds", "energy" and aligner
+              "features", and the windows of the scoring mode.
+    """
+    level = {
+        "motion": ref_motion,
+        "thresholds": build_thresholds({name: ref_motion}, THRESHOLD_PROFILES)[name],
+        "energy": trailing_mean(
+            compute_energy(ref_motion[:, :, REFERENCE_XY_AXES]), ENERGY_WINDOW
+        ),
+        "features": np.ascontiguousarray(
+            ref_motion[:, :, REFERENCE_XY_AXES], dtype=np.float32
+        ),
+    }
+    if FULL_BODY:
+        level["joint_windows"] = SCORER.build_windows(
+            ref_motion, HAND_WINDOW, REFERENCE_XY_AXES, np.float32
+        )
+    elif SPATIAL_INDEX:
+        # Cells as large as the largest threshold, so a query visits 3x3 cells
+        level["hand_grids"] = build_hand_grids(
+            ref_motion, float(level["thresholds"].max()), REFERENCE_XY_AXES
+        )
+    else:
+        level["hand_windows"] = build_hand_windows(
+            ref_motion, HAND_WINDOW, REFERENCE_XY_AXES
+        )
+    if SEND_ANGLES:
+        ref_angles = compute_reference_angles(
+            {name: ref_motion}, ANGLE_INDICES, REFERENCE_XY_AXES
+        )[name]
+        level["angle_windows"] = build_angle_windows(ref_angles, HAND_WINDOW)
+    return level
+
+
+def get_session(source):
+    if source not in SESSIONS:
+        SESSIONS[source] = SpectatorSession(source, CURRENT_LEVEL)
+    return SESSIONS[source]
 
 
 def is_hand_position_close(hand_position, ref_positions, threshold=0.1):
@@ -75,31 +233,158 @@ def mirror_positions(ref_positions):
 # plt.ion()  # Turn on interactive mode
 
 
-def process_and_send_data(address, *args):
-    """Receive data via OSC, compute metrics, and send results back."""
-    global SPECTATOR_XY_AXES, previous_spec_frame, last_send_time, TEMP_INCREMENT
+def process_and_send_data(address, args):
+    """Score a received frame right away, on the OSC loop, and send results back."""
+    process_and_send_batch([(address, args)])
+
+
+def receive_shm_frame(source, spec_frame_number, joints):
+    """
+    Handler of the frames of the shared-memory ring, called from its polling
+    thread. The frames are passed on as coming from /data<source>.
+    """
+    address, args = blob_source_address(source), (joints, spec_frame_number)
+    if WORKER is not None:
+        WORKER.submit_args(address, args)
+    else:
+        # Inline scoring stays on the OSC loop
+        EVENT_LOOP.call_soon_threadsafe(process_and_send_data, address, args)
+
+
+def receive_data(address, *args):
+    """
+    Dispatcher handler of the frames: /data* messages with one float per
+    coordinate, and /datab messages with a single blob (see
+    `fast_osc.encode_skeleton_blob`), which are passed on as coming from the
+    /data address of their source.
+    """
+    # The /data* pattern also matches /datab, python-osc cannot exclude it
+    if address == BLOB_ADDRESS:
+        try:
+            source, spec_frame_number, joints = decode_skeleton_blob(args[0])
+        except Exception as e:
+            print(f"Error decoding {BLOB_ADDRESS} message: {e}")
+            return
+        DATA_HANDLER(blob_source_address(source), (joints, spec_frame_number))
+    else:
+        DATA_HANDLER(address, args)
+
+
+def parse_frame(args):
+    """
+    Frame number and raw 3D skeleton of a frame message.
+
+    Parameters:
+        args (sequence): Arguments of a /data message (the joint coordinates,
+                         three unused values and the frame number), or the
+                         (joints, frame_number) pair of a /datab blob.
+
+    Returns:
+        tuple: (spec_frame_number, raw_spectator_frame), the skeleton of shape
+               (n_joints, 3).
+    """
+    if len(args) == 2 and isinstance(args[0], np.ndarray):
+        joints, spec_frame_number = args
+    else:
+        joints, spec_frame_number = args[:-4], args[-1]
+    # No copy for float64 arrays, the frames are stacked in a new array afterwards
+    return spec_frame_number, np.asarray(joints, dtype=float).reshape(
+        len(JOINTS_NAMES_TO_IDX), 3
+    )
 
-    try:
-        # Parse incoming OSC message
-        spec_frame_number = args[-1]  # in FRAMES... Reset on end
-        ref_frame_idx = int(spec_frame_number)
-
-        # Reshape incoming frame and normalize skeleton
-        raw_spectator_frame = np.array(args[:-4]).reshape(-1, 3)
-        spectator_frame = normalize_skeleton(raw_spectator_frame)
-        if SPECTATOR_XY_AXES is None:
-            SPECTATOR_XY_AXES = get_orthogonal_indices(
-                spectator_frame[JOINTS_NAMES_TO_IDX["LeftShoulder"]],
-                spectator_frame[JOINTS_NAMES_TO_IDX["RightShoulder"]],
-                spectator_frame[JOINTS_NAMES_TO_IDX["Neck"]],
-                spectator_frame[JOINTS_NAMES_TO_IDX["Hips"]],
-            )
-        spectator_frame = spectator_frame[:, SPECTATOR_XY_AXES]  # Work in 2D
-        spectator_frame[:, 0] *= -1  # Flip x-axis
 
-        ref_frame = REF_MOTION["choreography"][ref_frame_idx][:, REFERENCE_XY_AXES]
+def process_and_send_batch(messages):
+    """
+    Score a batch of /data messages, typically one per spectator for the same
+    tick, with a single NumPy call and send each spectator's result back.
+    """
+    global last_send_time
+
+    t = METRICS.clock()
+    METRICS.count("frames", len(messages))
+
+    # Parse incoming OSC messages
+    sessions, levels, ref_frame_indices, raw_frames = [], [], [], []
+    references = []
+    for address, args in messages:
+        try:
+            # Frame number in FRAMES... Reset on end
+            spec_frame_number, raw_spectator_frame = parse_frame(args)
+            ref_frame_idx = int(spec_frame_number)
+            if not np.all(np.isfinite(raw_spectator_frame)):
+                # Would spoil the batch it is stacked with
+                raise ValueError("The frame contains invalid coordinates.")
+
+            session = get_session(address[len("/data") :])
+            if session.xy_axes is None:
+                # The axes do not depend on the normalization
+                session.xy_axes = get_orthogonal_indices(
+                    raw_spectator_frame[JOINTS_NAMES_TO_IDX["LeftShoulder"]],
+                    raw_spectator_frame[JOINTS_NAMES_TO_IDX["RightShoulder"]],
+                    raw_spectator_frame[JOINTS_NAMES_TO_IDX["Neck"]],
+                    raw_spectator_frame[JOINTS_NAMES_TO_IDX["Hips"]],
+                )
+
+            # The same version of the level is used for the whole frame, even
+            # if it is reloaded meanwhile
+            level = LEVELS.get(session.level)
+            references.append(get_reference_windows(level, ref_frame_idx))
+            raw_frames.append(raw_spectator_frame)
+            ref_frame_indices.append(ref_frame_idx)
+            levels.append(level)
+            sessions.append(session)
+        except Exception as e:
+            METRICS.count("errors")
+            print(f"Error processing data: {e}")
+    if not sessions:
+        return
+    t = METRICS.record("parse", t)
+
+    try:
+        # Normalize all skeletons and work in 2D
+        spectator_frames = np.stack(raw_frames)
+        normalize_skeleton(spectator_frames, out=spectator_frames)
+        t = METRICS.record("normalize", t)
+        xy_axes = np.array([session.xy_axes for session in sessions])
+        spectator_frames = np.take_along_axis(
+            spectator_frames, xy_axes[:, np.newaxis, :], axis=2
+        )
+        spectator_frames[:, :, 0] *= -1  # Flip x-axis
+        t = METRICS.record("project", t)
+
+        if ALIGN:
+            # Score against the estimated reference positions instead of the
+            # frame counters, a spectator that fails is left out of the batch
+            ref_positions, kept = [], []
+            for i, session in enumerate(sessions):
+                try:
+                    ref_positions.append(
+                        align_frame(
+                            session, levels[i], spectator_frames[i], ref_frame_indices[i]
+                        )
+                    )
+                    kept.append(i)
+                except Exception as e:
+                    METRICS.count("errors")
+                    print(f"Error aligning spectator {session.source}: {e}")
+            if len(kept) < len(sessions):
+                if not kept:
+                    return
+                sessions = [sessions[i] for i in kept]
+                levels = [levels[i] for i in kept]
+                ref_frame_indices = [ref_frame_indices[i] for i in kept]
+                spectator_frames = spectator_frames[kept]
+            references = [
+                get_reference_windows(level, ref_positions[i])
+                for i, level in enumerate(levels)
+            ]
+            t = METRICS.record("align", t)
+        else:
+            ref_positions = ref_frame_indices
+        hand_windows, thresholds, angle_windows = zip(*references)
 
         # Visualization
+        # ref_frame = REF_MOTION["choreography"][ref_frame_idx][:, REFERENCE_XY_AXES]
         # ax.clear()  # Clear previous plot
         # draw_skeleton(spectator_frame, PARENTS)  # Draw spectator frame
         # draw_skeleton(ref_frame, PARENTS)  # Draw reference frame
@@ -109,131 +394,349 @@ def process_and_send_data(address, *args):
         # plt.draw()
         # plt.pause(0.001)  # Pause briefly to update the plot
 
-        # Get the 2D positions of the spectator's hands
-        left_hand_pos = spectator_frame[JOINTS_NAMES_TO_IDX["LeftHand"]]
-        right_hand_pos = spectator_frame[JOINTS_NAMES_TO_IDX["RightHand"]]
-
-        # Get reference positions for the last second
-        ref_left_hand_positions = [
-            frame[JOINTS_NAMES_TO_IDX["LeftHand"], REFERENCE_XY_AXES]
-            for frame in REF_MOTION[CURRENT_LEVEL][
-                max(0, ref_frame_idx - 30) : ref_frame_idx + 1
-            ]
-        ]
-        ref_right_hand_positions = [
-            frame[JOINTS_NAMES_TO_IDX["RightHand"], REFERENCE_XY_AXES]
-            for frame in REF_MOTION[CURRENT_LEVEL][
-                max(0, ref_frame_idx - 30) : ref_frame_idx + 1
-            ]
-        ]
-
-        ref_left_hand_positions = np.vstack(ref_left_hand_positions)
-        ref_right_hand_positions = np.vstack(ref_right_hand_positions)
-
-        # Include mirrored positions for comparison
-        mirrored_left_hand_positions = mirror_positions(ref_left_hand_positions)
-        mirrored_right_hand_positions = mirror_positions(ref_right_hand_positions)
-        all_valid_left_positions = np.vstack(
-            (ref_left_hand_positions, mirrored_right_hand_positions)
-        )
-        all_valid_right_positions = np.vstack(
-            (ref_right_hand_positions, mirrored_left_hand_positions)
-        )
-
-        left_hand_up = left_hand_pos[1] > 0.25
-        right_hand_up = right_hand_pos[1] > 0.25
-
-        if not (left_hand_up) and not (right_hand_up):
-            print("Frame ignored, both hands are down")
-            return 0
-        else:  # both hands are up
-            # Check if hands are close to any reference positions
-            left_hand_valid = is_hand_position_close(
-                left_hand_pos,
-                all_valid_left_positions,
-                threshold=THRESHOLDS[CURRENT_LEVEL][ref_frame_idx],
+        # Get the 2D positions of the spectators' hands, frames with both
+        # hands down are ignored
+        hand_positions = spectator_frames[:, HANDS_IDX]
+        hands_up = np.any(hand_positions[:, :, 1] > 0.25, axis=1)
+        thresholds = np.array(thresholds)
+        if not SPATIAL_INDEX:
+            hand_windows = np.stack(hand_windows)
+        t = METRICS.record("window", t)
+
+        # Check if hands are close to any reference positions of the last
+        # second, including mirrored positions
+        if FULL_BODY:
+            # Same test on every scored joint, with weights and per-segment thresholds
+            choreography_valid, scores, _ = SCORER.score(
+                spectator_frames, hand_windows, thresholds
             )
-
-            right_hand_valid = is_hand_position_close(
-                right_hand_pos,
-                all_valid_right_positions,
-                threshold=THRESHOLDS[CURRENT_LEVEL][ref_frame_idx],
+        elif not SPATIAL_INDEX:
+            choreography_valid = np.all(
+                hands_close(hand_positions, hand_windows, thresholds), axis=1
+            )
+        else:
+            choreography_valid = np.array(
+                [
+                    hands_close_indexed(
+                        hand_positions[i],
+                        level["hand_grids"],
+                        ref_positions[i],
+                        HAND_WINDOW,
+                        thresholds[i],
+                    ).all()
+                    for i, level in enumerate(levels)
+                ]
+            )
+        t = METRICS.record("distance", t)
+
+        if SEND_ANGLES:
+            # Best matching reference frame of the window, and the lag to it
+            angles_valid, angles_lag = match_angles(
+                compute_angles(spectator_frames, ANGLE_INDICES),
+                np.stack(angle_windows),
+                ANGLE_TOLERANCE,
             )
 
-            # Send results at specified intervals
-            choreography_valid = bool(left_hand_valid and right_hand_valid)
-        client.send_message("/results", choreography_valid)
-        print(
-            f"{ref_frame_idx}/  {choreography_valid}  /  {THRESHOLDS[CURRENT_LEVEL][ref_frame_idx]}"
-        )
+        for i, session in enumerate(sessions):
+            # A failing spectator does not prevent sending the others' results
+            try:
+                if SEND_ENERGY:
+                    send_energy(
+                        session, levels[i], spectator_frames[i], ref_frame_indices[i]
+                    )
+                if SEND_ANGLES:
+                    client.send_message(
+                        f"/angles{session.source}",
+                        [bool(angles_valid[i]), int(angles_lag[i])],
+                    )
+                session.previous_frame = spectator_frames[i]
+                session.previous_frame_number = ref_frame_indices[i]
+                if not hands_up[i]:
+                    print("Frame ignored, both hands are down")
+                    continue
+                result = bool(choreography_valid[i])
+                if ECHO_FRAME_NUMBER:
+                    result = [result, ref_frame_indices[i]]
+                client.send_message(f"/results{session.source}", result)
+                prefix = f"[{session.source}] " if session.source else ""
+                score = f"  /  score {scores[i]:.2f}" if FULL_BODY else ""
+                print(
+                    f"{prefix}{ref_frame_indices[i]}/  {bool(choreography_valid[i])}  /  {thresholds[i]:g}{score}"
+                )
+            except Exception as e:
+                METRICS.count("errors")
+                print(f"Error sending results of spectator {session.source}: {e}")
+        METRICS.record("send", t)
 
     except Exception as e:
+        METRICS.count("errors", len(sessions))
         print(f"Error processing data: {e}")
 
 
+def get_reference_windows(level, ref_frame_idx):
+    """Windows (for the scoring mode in use), threshold and angle windows of a reference frame."""
+    if FULL_BODY:
+        windows = level["joint_windows"][ref_frame_idx]
+    elif not SPATIAL_INDEX:
+        windows = level["hand_windows"][ref_frame_idx]
+    else:
+        windows = None  # The grids are queried with the frame index
+    angle_windows = level["angle_windows"][ref_frame_idx] if SEND_ANGLES else None
+    return windows, level["thresholds"][ref_frame_idx], angle_windows
+
+
+def align_frame(session, level, spectator_frame, spec_frame_idx):
+    """Estimate the reference frame of the spectator, send it with the lag."""
+    if session.aligner is None or session.aligner_level is not level:
+        # New level, or new version of the reference
+        session.aligner = OnlineAligner(level["features"], ALIGN_BAND)
+        session.aligner_level = level
+    # The aligner restarts by itself when the frame counter is reset
+    position = session.aligner.update(spectator_frame, hint=spec_frame_idx)
+    client.send_message(
+        f"/alignment{session.source}", [position, spec_frame_idx - position]
+    )
+    return position
+
+
+def send_energy(session, level, spectator_frame, ref_frame_idx):
+    """Update the spectator's energy and send it with the reference one."""
+    if session.previous_frame_number is not None:
+        if ref_frame_idx < session.previous_frame_number:
+            session.energy.reset()  # The frame counter was reset
+        elif ref_frame_idx - session.previous_frame_number != 1:
+            # Frames were dropped or superseded, the acceleration would span the gap
+            session.energy.restart_frames()
+    session.energy.update(spectator_frame)
+    # The tracker knows the energy up to the previous frame
+    ref_energy = level["energy"][max(ref_frame_idx - 1, 0)]
+    client.send_message(
+        f"/energy{session.source}", [session.energy.mean, float(ref_energy)]
+    )
+
+
+def send_stats():
+    stats = METRICS.summary()
+    if WORKER is not None:
+        stats["ingest"] = dict(WORKER.stats)
+    if PROTOCOL is not None:
+        stats["osc"] = dict(PROTOCOL.stats)
+    if CONSUMER is not None:
+        stats["shm"] = dict(CONSUMER.stats)
+    client.send_message("/stats", json.dumps(stats))
+
+
 async def loop():
+    last_stats_time = time.time()
     while True:
         await asyncio.sleep(1)
+        if METRICS.enabled and time.time() - last_stats_time >= STATS_INTERVAL:
+            last_stats_time = time.time()
+            send_stats()
 
 
 async def main():
+    global WORKER, DATA_HANDLER, PROTOCOL, CONSUMER, EVENT_LOOP
+
+    EVENT_LOOP = asyncio.get_event_loop()
     dispatcher = Dispatcher()
-    dispatcher.map("/data*", process_and_send_data)
+    if INGEST_MODE == "worker":
+        # Only enqueue frames on the OSC loop, score them in another thread
+        WORKER = ScoringWorker(
+            process_and_send_batch, INGEST_QUEUE_SIZE, INGEST_DROP_OLDEST, batch=True
+        )
+    elif INGEST_MODE == "latest":
+        WORKER = CoalescingScoringWorker(process_and_send_batch, batch=True)
+
+    if WORKER is not None:
+        WORKER.start()
+        DATA_HANDLER = WORKER.submit_args
+    else:
+        DATA_HANDLER = process_and_send_data
+    dispatcher.map("/data*", receive_data)
     dispatcher.map("/level", load_level)
     dispatcher.map("/ping", answer_ping)
+    dispatcher.map("/dropped", answer_dropped)
 
-    server = AsyncIOOSCUDPServer(
-        (OSC_IP, OSC_PORT), dispatcher, asyncio.get_event_loop()
-    )
-    transport, protocol = await server.create_serve_endpoint()
+    if FAST_OSC:
+        # Frames are decoded into arrays, the other messages use the dispatcher
+        transport, PROTOCOL = await asyncio.get_event_loop().create_datagram_endpoint(
+            lambda: FastOSCProtocol(dispatcher, DATA_HANDLER, "/data"),
+            local_addr=(OSC_IP, OSC_PORT),
+        )
+    else:
+        server = AsyncIOOSCUDPServer(
+            (OSC_IP, OSC_PORT), dispatcher, asyncio.get_event_loop()
+        )
+        transport, protocol = await server.create_serve_endpoint()
+
+    if INGEST_BACKEND == "shm":
+        CONSUMER = ShmFrameConsumer(
+            SHM_NAME, SHM_SLOTS, len(JOINTS_NAMES_TO_IDX), SHM_REPLACE
+        )
+        # Polled from a thread, the OSC loop would add up to a millisecond
+        CONSUMER.start(receive_shm_frame, SHM_POLL_INTERVAL)
+        print(f"Reading frames from shared memory {SHM_NAME}")
 
     print(f"Server is running on {OSC_IP}:{OSC_PORT}")
-    await loop()
-    transport.close()
+    try:
+        await loop()
+    finally:
+        transport.close()
+        if CONSUMER is not None:
+            CONSUMER.close()
+        if WORKER is not None:
+            WORKER.stop()
+        LEVELS.stop_watching()
 
 
 if __name__ == "__main__":
-    REF_MOTION = {
-        "choreography": extract_ref_motion_data(
-            "./choreography_fixed.bvh"
-        ),  # from root folder
-        "mutation": extract_ref_motion_data("./mutation_dance_fixed.bvh"),
-    }
-    REF_MOTION = {key: normalize_skeleton(val) for key, val in REF_MOTION.items()}
-
-    # Different thresholds for different
-    choreography_thresholds = np.ones(REF_MOTION["choreography"].shape[0])
-    # First movement (wave)
-    choreography_thresholds[0:600] = 0.2
-    # Second movements
-    choreography_thresholds[600:680] = 0.1
-    # Third movement
-    choreography_thresholds[680:985] = 0.1
-    # Fourth movement (static )
-    choreography_thresholds[680:1400] = 0.05
-    # Fifth movement
-    choreography_thresholds[1400:1700] = 0.1
-    # Sixth movement
-    choreography_thresholds[1700:1800] = 0.1
-    # Seventh
-    choreography_thresholds[1800:2000] = 0.1
-    # Eight
-    choreography_thresholds[2000:2190] = 0.1
-    # Ninth
-    choreography_thresholds[2190:2278] = 0.1
-    # Tenth (static)
-    choreography_thresholds[2278:2450] = 0.05
-    # 11 (Wave)
-    choreography_thresholds[2450:2680] = 0.12
-    # 12 recule et saute
-    choreography_thresholds[2680:3030] = 0.1
-    # 13
-    choreography_thresholds[3030:] *= 0.12
-
-    # Mutation should be easy
-    mutation_thresholds = np.ones(REF_MOTION["mutation"].shape[0]) * 0.1
-    THRESHOLDS = {
-        "choreography": choreography_thresholds,
-        "mutation": mutation_thresholds,
-    }
+    parser = argparse.ArgumentParser(description="Live dance scoring OSC server.")
+    parser.add_argument(
+        "--ingest",
+        choices=["inline", "worker", "latest"],
+        default=INGEST_MODE,
+        help="Score frames on the OSC loop, in a dedicated worker thread, or in a "
+        "worker thread that skips to the newest frame of each spectator.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=INGEST_QUEUE_SIZE,
+        help="Maximum number of frames waiting to be scored in worker mode.",
+    )
+    parser.add_argument(
+        "--drop-newest",
+        action="store_true",
+        help="When the queue is full, drop incoming frames instead of the oldest ones.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Measure per-stage timings, frame rate and errors, sent periodically on /stats.",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=STATS_INTERVAL,
+        help="Interval at which /stats is sent (in seconds).",
+    )
+    parser.add_argument(
+        "--stats-csv", help="Also append each /stats summary to this CSV file."
+    )
+    parser.add_argument(
+        "--echo-frame",
+        action="store_true",
+        help="Append the frame number to /results, used to measure latency.",
+    )
+    parser.add_argument(
+        "--energy",
+        action="store_true",
+        help="Send the spectator's mean energy and the reference one on /energy.",
+    )
+    parser.add_argument(
+        "--angles",
+        action="store_true",
+        help="Send whether the joint angles match the reference and the lag on /angles.",
+    )
+    parser.add_argument(
+        "--hand-window",
+        type=int,
+        default=HAND_WINDOW,
+        help="Number of past reference frames the hands and angles can match.",
+    )
+    parser.add_argument(
+        "--spatial-index",
+        action="store_true",
+        help="Query a grid of the reference hand trajectories instead of precomputed "
+        "windows, whose memory grows with --hand-window.",
+    )
+    parser.add_argument(
+        "--full-body",
+        action="store_true",
+        help="Score the joints of FULL_BODY_JOINTS with their weights and segment "
+        "thresholds instead of the hands only.",
+    )
+    parser.add_argument(
+        "--align",
+        action="store_true",
+        help="Align the spectator with the reference by online DTW instead of trusting "
+        "the frame counter, and send the position and lag on /alignment.",
+    )
+    parser.add_argument(
+        "--threshold-profiles",
+        default=THRESHOLD_PROFILES_DIR,
+        help="Folder of the threshold profiles, one <level>.json per level.",
+    )
+    parser.add_argument(
+        "--levels-dir",
+        default=LEVELS_DIR,
+        help="Folder of the BVH references, one level per file.",
+    )
+    parser.add_argument(
+        "--no-watch-levels",
+        action="store_true",
+        help="Do not reload new and modified references while running.",
+    )
+    parser.add_argument(
+        "--fast-osc",
+        action="store_true",
+        help="Decode the /data frames directly into NumPy buffers.",
+    )
+    parser.add_argument(
+        "--ingest-backend",
+        choices=["osc", "shm"],
+        default=INGEST_BACKEND,
+        help="Also read the frames from a shared-memory ring with shm, for capture "
+        "tools on the same machine.",
+    )
+    parser.add_argument(
+        "--shm-name", default=SHM_NAME, help="Name of the shared-memory ring."
+    )
+    parser.add_argument(
+        "--shm-slots",
+        type=int,
+        default=SHM_SLOTS,
+        help="Number of frames held by the shared-memory ring.",
+    )
+    parser.add_argument(
+        "--shm-replace",
+        action="store_true",
+        help="Remove an existing shared-memory ring of the same name, left behind "
+        "by a server that did not exit cleanly.",
+    )
+    cli_args = parser.parse_args()
+    if cli_args.full_body and cli_args.spatial_index:
+        parser.error("--spatial-index only supports the hands, not --full-body.")
+    if cli_args.queue_size < 1:
+        parser.error("--queue-size must be at least 1.")
+    INGEST_MODE = cli_args.ingest
+    INGEST_QUEUE_SIZE = cli_args.queue_size
+    INGEST_DROP_OLDEST = not cli_args.drop_newest
+    METRICS.enabled = cli_args.stats
+    METRICS.csv_path = cli_args.stats_csv
+    STATS_INTERVAL = cli_args.stats_interval
+    ECHO_FRAME_NUMBER = cli_args.echo_frame
+    SEND_ENERGY = cli_args.energy
+    SEND_ANGLES = cli_args.angles
+    HAND_WINDOW = cli_args.hand_window
+    FULL_BODY = cli_args.full_body
+    ALIGN = cli_args.align
+    SPATIAL_INDEX = cli_args.spatial_index
+    THRESHOLD_PROFILES = cli_args.threshold_profiles
+    LEVELS_DIR = cli_args.levels_dir
+    WATCH_LEVELS = not cli_args.no_watch_levels
+    FAST_OSC = cli_args.fast_osc
+    INGEST_BACKEND = cli_args.ingest_backend
+    SHM_NAME = cli_args.shm_name
+    SHM_SLOTS = cli_args.shm_slots
+    SHM_REPLACE = cli_args.shm_replace
+
+    if FULL_BODY:
+        SCORER = build_full_body_scorer()
+    LEVELS = LevelRegistry(LEVELS_DIR, prepare_level)
+    LEVELS.load_all()
+    print(f"Loaded levels {LEVELS.names}")
+    if WATCH_LEVELS:
+        LEVELS.start_watching()
     asyncio.run(main())
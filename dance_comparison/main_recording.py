@@ -1,4 +1,5 @@
 import asyncio
+import os
 import time
 
 try:
@@ -18,6 +19,8 @@ from pythonosc.osc_server import AsyncIOOSCUDPServer
 from skeleton_utils import normalize_skeleton, JOINTS_NAMES_TO_IDX, PARENTS
 from utils import extract_ref_motion_data, get_orthogonal_indices
 from draw_utils import draw_skeleton
+from thresholds import build_thresholds
+from recorder import Recorder
 
 # Which axes are front-up etc. CHANGES for the incoming data depending on initialization
 SPECTATOR_XY_AXES = None
@@ -35,8 +38,17 @@ RESULT_INTERVAL = 1  # Interval at which to send results of the analysis (in sec
 CURRENT_LEVEL = "choreography"
 REF_FRAMETIME = 1 / 30  # It should not change!!!!!
 REF_MOTION = None
-IDX_TO_LEVEL = {0: "choreography", 1: "mutation_dance"}
-LEVEL_TO_IDX = {"choreography": 0, "mutation_dance": 1}
+IDX_TO_LEVEL = {0: "mutation_dance", 1: "choreography"}
+LEVEL_TO_IDX = {"mutation_dance": 0, "choreography": 1}
+
+# RECORDING
+RECORDING_DIR = "my_motion_data"  # One recording per run, in a timestamped subfolder
+RECORDING_CHUNK_SIZE = 300  # Frames per segment written to disk (10 seconds at 30 fps)
+RECORDING_DTYPES = {  # Columns not listed are stored as float32
+    "frame_number": np.int64,
+    "receive_time": np.float64,  # time.monotonic() in seconds
+}
+RECORDER = None
 
 # History to compute smoothing
 previous_spec_frame = None
@@ -74,19 +86,16 @@ def mirror_positions(ref_positions):
 # fig, ax = plt.subplots()
 # plt.ion()  # Turn on interactive mode
 
-recorded_frames = []  # List to store recorded frames for saving
-
-
 def process_and_send_data(address, *args):
     """Receive data via OSC, compute metrics, and send results back."""
     global SPECTATOR_XY_AXES, previous_spec_frame, last_send_time, TEMP_INCREMENT
-    global recorded_framesw
 
     try:
         # Parse incoming OSC message
+        receive_time = time.monotonic()
         spec_frame_number = args[-1]  # in FRAMES... Reset on end
-        time = spec_frame_number / 24
-        ref_frame_idx = int(time / REF_FRAMETIME)
+        spec_time = spec_frame_number / 24
+        ref_frame_idx = int(spec_time / REF_FRAMETIME)
 
         # Reshape incoming frame and normalize skeleton
         raw_spectator_frame = np.array(args[:-4]).reshape(-1, 3)
@@ -98,11 +107,17 @@ def process_and_send_data(address, *args):
                 spectator_frame[JOINTS_NAMES_TO_IDX["Neck"]],
                 spectator_frame[JOINTS_NAMES_TO_IDX["Hips"]],
             )
+            RECORDER.set_metadata(xy_axes=[int(axis) for axis in SPECTATOR_XY_AXES])
         spectator_frame = spectator_frame[:, SPECTATOR_XY_AXES]  # Work in 2D
         spectator_frame[:, 0] *= -1  # Flip x-axis
 
-        # Record the frame
-        recorded_frames.append(spectator_frame)
+        # Record the projected frame with what is needed to redo the processing
+        RECORDER.append(
+            frames=spectator_frame,
+            raw=raw_spectator_frame,
+            frame_number=spec_frame_number,
+            receive_time=receive_time,
+        )
 
         # ref_frame = REF_MOTION["choreography"][ref_frame_idx][:, REFERENCE_XY_AXES]
 
@@ -167,12 +182,11 @@ def process_and_send_data(address, *args):
         print(f"Error processing data: {e}")
 
 
-def save_recorded_data(filename="recorded_frames.npy"):
-    """Save the recorded movement data to an .npy file."""
-    global recorded_frames
+def save_recorded_data():
+    """Write the frames not yet on disk and close the recording."""
     try:
-        np.save(filename, np.array(recorded_frames))
-        print(f"Recorded data saved to {filename}.")
+        RECORDER.close()
+        print(f"Recorded data saved to {RECORDER.directory} ({RECORDER.n_frames} frames).")
     except Exception as e:
         print(f"Error saving data: {e}")
 
@@ -183,6 +197,16 @@ async def loop():
 
 
 async def main():
+    global RECORDER
+
+    # A new folder per run, the metadata (axes, start time) is the one of a session
+    recording_dir = os.path.join(RECORDING_DIR, time.strftime("%Y%m%d-%H%M%S"))
+    RECORDER = Recorder(recording_dir, RECORDING_CHUNK_SIZE, RECORDING_DTYPES)
+    print(f"Recording to {recording_dir}")
+    # Relate the monotonic receive times to the wall clock
+    RECORDER.set_metadata(
+        start_time=time.time(), start_monotonic=time.monotonic(), flip_x=True
+    )
     dispatcher = Dispatcher()
     dispatcher.map("/data*", process_and_send_data)
     dispatcher.map("/level", load_level)
@@ -200,52 +224,19 @@ async def main():
     finally:
         transport.close()
         # Save the recorded data before exiting
-        save_recorded_data("my_motion_data.npy")
+        save_recorded_data()
         print("Server shut down and recorded data saved.")
 
 
 if __name__ == "__main__":
     REF_MOTION = {
         "choreography": extract_ref_motion_data(
-            "./choreography_fixed.bvh"
+            "./choreography_fixed.bvh", normalize=True
         ),  # from root folder
-        "mutation": extract_ref_motion_data("./mutation_dance_fixed.bvh"),
-    }
-    REF_MOTION = {key: normalize_skeleton(val) for key, val in REF_MOTION.items()}
-
-    # Different thresholds for different
-    choreography_thresholds = np.ones(REF_MOTION["choreography"].shape[0])
-    # First movement (wave)
-    choreography_thresholds[0:600] = 0.2
-    # Second movements
-    choreography_thresholds[600:680] = 0.1
-    # Third movement
-    choreography_thresholds[680:985] = 0.1
-    # Fourth movement (static )
-    choreography_thresholds[680:1400] = 0.05
-    # Fifth movement
-    choreography_thresholds[1400:1700] = 0.1
-    # Sixth movement
-    choreography_thresholds[1700:1800] = 0.1
-    # Seventh
-    choreography_thresholds[1800:2000] = 0.1
-    # Eight
-    choreography_thresholds[2000:2190] = 0.1
-    # Ninth
-    choreography_thresholds[2190:2278] = 0.1
-    # Tenth (static)
-    choreography_thresholds[2278:2450] = 0.05
-    # 11 (Wave)
-    choreography_thresholds[2450:2680] = 0.12
-    # 12 recule et saute
-    choreography_thresholds[2680:3030] = 0.1
-    # 13
-    choreography_thresholds[3030:] *= 0.12
-
-    # Mutation should be easy
-    mutation_thresholds = np.ones(REF_MOTION["mutation"].shape[0]) * 0.1
-    THRESHOLDS = {
-        "choreography": choreography_thresholds,
-        "mutation": mutation_thresholds,
+        "mutation_dance": extract_ref_motion_data(
+            "./mutation_dance_fixed.bvh", normalize=True
+        ),
     }
+
+    THRESHOLDS = build_thresholds(REF_MOTION)
     asyncio.run(main())
@@ -0,0 +1,102 @@
+# Lightweight timing and throughput metrics for the scoring server
+import csv
+import os
+import time
+
+import numpy as np
+
+
+class Metrics:
+    """
+    Per-stage timings (rolling p50/p95/p99), frame rate and counters.
+
+    Timings are recorded with the clock/record pair:
+
+        t = METRICS.clock()
+        ...  # parse
+        t = METRICS.record("parse", t)
+
+    When disabled, clock and record return immediately, so the instrumentation
+    can stay in the hot path.
+    """
+
+    def __init__(self, stages, enabled=False, window=1000, csv_path=None):
+        """
+        Parameters:
+            stages (list): Names of the timed stages, in order.
+            enabled (bool): Record timings and counters.
+            window (int): Number of last timings used for the percentiles.
+            csv_path (str): Optional CSV file to which each summary is appended.
+        """
+        self.stages = list(stages)
+        self.enabled = enabled
+        self.window = window
+        self.csv_path = csv_path
+        self.counts = {}
+
+        self._timings = {stage: np.zeros(window) for stage in self.stages}
+        self._n_timings = {stage: 0 for stage in self.stages}
+        self._last_summary_time = time.perf_counter()
+        self._last_frames = 0
+
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def record(self, stage, start):
+        """Record the time spent in `stage` since `start`, return the current clock."""
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self._timings[stage][self._n_timings[stage] % self.window] = now - start
+        self._n_timings[stage] += 1
+        return now
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def summary(self):
+        """
+        Summarize the metrics since the previous summary.
+
+        Returns:
+            dict: "fps" (frames per second), "counts" and, for each stage, its
+                  p50, p95 and p99 durations in milliseconds.
+        """
+        now = time.perf_counter()
+        frames = self.counts.get("frames", 0)
+        fps = (frames - self._last_frames) / (now - self._last_summary_time)
+        self._last_summary_time, self._last_frames = now, frames
+
+        stages = {}
+        for stage in self.stages:
+            timings = self._timings[stage][: min(self._n_timings[stage], self.window)]
+            if len(timings) == 0:
+                continue
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+            stages[stage] = {"p50": p50, "p95": p95, "p99": p99}
+
+        summary = {"fps": fps, "counts": dict(self.counts), "stages": stages}
+        if self.csv_path is not None:
+            self._write_csv(summary)
+        return summary
+
+    def _write_csv(self, summary):
+        write_header = not os.path.exists(self.csv_path)
+        with open(self.csv_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(
+                    ["time", "fps", "frames", "errors"]
+                    + [f"{s}_{p}" for s in self.stages for p in ("p50", "p95", "p99")]
+                )
+            row = [
+                time.time(),
+                summary["fps"],
+                summary["counts"].get("frames", 0),
+                summary["counts"].get("errors", 0),
+            ]
+            for stage in self.stages:
+                percentiles = summary["stages"].get(stage, {})
+                row += [percentiles.get(p, "") for p in ("p50", "p95", "p99")]
+            writer.writerow(row)
@@ -0,0 +1,257 @@
+# Streaming recording of frames to disk in fixed-size chunks
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+RECORDING_INDEX = "index.json"
+RECORDING_VERSION = 2
+
+
+class Recorder:
+    """
+    Record frames with constant memory, as named columns (e.g. the projected
+    frame, the raw skeleton, the frame number and the receive time). Values are
+    copied into preallocated chunks, one array per column, and every full chunk
+    is written by a background thread as one .npy segment per column, then
+    listed in the index of the recording. A crash loses at most the frames of
+    the chunk being filled.
+
+    A recording is a folder:
+
+        my_motion_data/
+            index.json                  {"version", "columns", "metadata", "frames", "segments"}
+            segment_00000_frames.npy
+            segment_00000_raw.npy
+            ...
+
+    Opening an existing recording appends to it. Read it with `load_recording`
+    or `load_recording_columns`.
+    """
+
+    def __init__(self, directory, chunk_size=300, dtypes=None, max_pending=4):
+        """
+        Parameters:
+            directory (str): Folder of the recording, created if needed.
+            chunk_size (int): Number of frames per segment.
+            dtypes (dict): Type in which each column is stored, columns that are
+                           not listed are stored as float32.
+            max_pending (int): Number of full chunks waiting to be written. When
+                               the disk cannot keep up, `append` blocks.
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.dtypes = dtypes or {}
+        os.makedirs(directory, exist_ok=True)
+
+        index_path = os.path.join(directory, RECORDING_INDEX)
+        if os.path.exists(index_path):
+            self._index = _read_index(directory)
+        else:
+            self._index = {
+                "version": RECORDING_VERSION,
+                "columns": None,
+                "metadata": {},
+                "frames": 0,
+                "segments": [],
+            }
+
+        # Chunks are recycled once written, so at most max_pending + 2 exist
+        self._chunk = None
+        self._n_frames = 0
+        self._free_chunks = queue.Queue()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._thread.start()
+
+    def append(self, **values):
+        """
+        Add a frame to the recording, given as one value per column, e.g.
+        append(frames=frame, frame_number=12). Every frame has the same columns.
+        """
+        if self._chunk is None:
+            self._chunk = self._new_chunk(values)
+        for column, value in values.items():
+            self._chunk[column][self._n_frames] = value
+        self._n_frames += 1
+        if self._n_frames == self.chunk_size:
+            self.flush()
+
+    def set_metadata(self, **metadata):
+        """
+        Information about the whole recording (e.g. the calibration axes), saved
+        in the index. When appending to a recording, a value that differs from
+        the recorded one raises a ValueError: the earlier frames would be read
+        with the wrong metadata, record the new session in another folder.
+        """
+        with self._lock:
+            recorded = self._index["metadata"]
+            if self._index["frames"] > 0 or self._index["segments"]:
+                conflicts = {
+                    key: (recorded[key], value)
+                    for key, value in metadata.items()
+                    if key in recorded and recorded[key] != value
+                }
+                if conflicts:
+                    raise ValueError(
+                        f"Metadata {conflicts} (recorded, new) differ from the frames "
+                        f"already in {self.directory}."
+                    )
+            recorded.update(metadata)
+
+    def flush(self):
+        """Hand the frames of the current chunk to the writer, even if it is not full."""
+        if self._n_frames == 0:
+            return
+        self._pending.put((self._chunk, self._n_frames))
+        self._chunk, self._n_frames = None, 0
+
+    def close(self):
+        """Write the remaining frames and the index, and wait for the writer to finish."""
+        self.flush()
+        self._pending.put(None)
+        self._thread.join()
+        self._write_index()
+
+    @property
+    def n_frames(self):
+        """Number of frames written to disk."""
+        return self._index["frames"]
+
+    def _new_chunk(self, values):
+        columns = {
+            column: {
+                "shape": list(np.shape(value)),
+                "dtype": np.dtype(self.dtypes.get(column, np.float32)).str,
+            }
+            for column, value in values.items()
+        }
+        with self._lock:
+            if self._index["columns"] is None:
+                self._index["columns"] = columns
+        if columns != self._index["columns"]:
+            raise ValueError(
+                f"Frame with columns {columns}, the recording has {self._index['columns']}."
+            )
+
+        try:
+            return self._free_chunks.get_nowait()
+        except queue.Empty:
+            return {
+                column: np.empty([self.chunk_size] + spec["shape"], dtype=spec["dtype"])
+                for column, spec in columns.items()
+            }
+
+    def _write_chunks(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            chunk, n_frames = item
+            try:
+                self._write_segment(chunk, n_frames)
+            except Exception as e:
+                print(f"Error writing recording segment: {e}")
+            self._free_chunks.put(chunk)
+
+    def _write_segment(self, chunk, n_frames):
+        files = {}
+        for column, values in chunk.items():
+            name = f"segment_{len(self._index['segments']):05d}_{column}.npy"
+            path = os.path.join(self.directory, name)
+            # Write then rename, so that a listed segment is always complete
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, values[:n_frames])
+            os.replace(path + ".tmp", path)
+            files[column] = name
+
+        with self._lock:
+            self._index["segments"].append({"frames": n_frames, "files": files})
+            self._index["frames"] += n_frames
+        self._write_index()
+
+    def _write_index(self):
+        index_path = os.path.join(self.directory, RECORDING_INDEX)
+        with self._lock:
+            with open(index_path + ".tmp", "w") as f:
+                json.dump(self._index, f)
+        os.replace(index_path + ".tmp", index_path)
+
+
+def _read_index(directory):
+    """Read the index of a recording, upgrading it to the current version."""
+    with open(os.path.join(directory, RECORDING_INDEX)) as f:
+        index = json.load(f)
+    if index["version"] == 1:
+        # Single column of projected frames
+        frame_shape = index.pop("frame_shape")
+        index["columns"] = (
+            {"frames": {"shape": frame_shape, "dtype": index.pop("dtype")}}
+            if frame_shape is not None
+            else None
+        )
+        index["metadata"] = {}
+        index["segments"] = [
+            {"frames": segment["frames"], "files": {"frames": segment["file"]}}
+            for segment in index["segments"]
+        ]
+        index["version"] = RECORDING_VERSION
+    return index
+
+
+def load_recording_columns(path, columns=None, mmap_mode=None):
+    """
+    Load the columns and metadata of a recording.
+
+    Parameters:
+        path (str): Folder written by `Recorder` (or its index.json), or a .npy
+                    file saved by the former `main_recording.save_recorded_data`,
+                    which only has the "frames" column.
+        columns (list): Columns to load, all by default.
+        mmap_mode (str): Memory-map the segments instead of reading them, only
+                         for single-segment recordings and .npy files.
+
+    Returns:
+        tuple: (columns, metadata), with an array of shape (n_frames, ...) per column.
+    """
+    if os.path.basename(path) == RECORDING_INDEX:
+        path = os.path.dirname(path)
+    if not os.path.isdir(path):
+        return {"frames": np.load(path, mmap_mode=mmap_mode)}, {}
+
+    index = _read_index(path)
+    specs = index["columns"] or {}
+    if columns is None:
+        columns = list(specs)
+
+    loaded = {}
+    for column in columns:
+        if column not in specs:
+            raise KeyError(f"The recording {path} has no column {column}.")
+        segments = [
+            np.load(os.path.join(path, segment["files"][column]), mmap_mode=mmap_mode)
+            for segment in index["segments"]
+        ]
+        if not segments:
+            loaded[column] = np.empty(
+                [0] + specs[column]["shape"], dtype=specs[column]["dtype"]
+            )
+        elif len(segments) == 1:
+            loaded[column] = segments[0]
+        else:
+            loaded[column] = np.concatenate(segments)
+    return loaded, index["metadata"]
+
+
+def load_recording(path, column="frames", mmap_mode=None):
+    """
+    Load one column of a recording, by default the projected 2D frames, see
+    `load_recording_columns`.
+
+    Returns:
+        np.ndarray: Values of shape (n_frames, ...).
+    """
+    return load_recording_columns(path, [column], mmap_mode)[0][column]
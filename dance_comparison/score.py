@@ -2,7 +2,203 @@
 import math
 import numpy as np
 
-from skeleton_utils import normalize_skeleton
+from skeleton_utils import (
+    normalize_skeleton,
+    JOINTS_NAMES_TO_IDX,
+    LIMBS,
+    MIRRORED_JOINTS_IDX,
+)
+
+HANDS_IDX = [JOINTS_NAMES_TO_IDX["LeftHand"], JOINTS_NAMES_TO_IDX["RightHand"]]
+
+# Full-body scoring (main.py and score_recordings.py --full-body)
+FULL_BODY_JOINTS = [
+    name for name in JOINTS_NAMES_TO_IDX if not name.endswith("_end_site")
+]
+FULL_BODY_WEIGHTS = {"LeftHand": 2, "RightHand": 2, "LeftFoot": 1.5, "RightFoot": 1.5}
+FULL_BODY_SEGMENT_SCALES = {  # Factor of the level threshold for each LIMBS segment
+    "torso": 0.5,
+    "left_arm": 1.5,  # Shoulder to wrist, with the LeftHand joint
+    "right_arm": 1.5,
+    "left_hand": 1.5,  # Fingers
+    "right_hand": 1.5,
+    "left_leg": 1.5,
+    "right_leg": 1.5,
+}
+FULL_BODY_PASS_RATIO = 0.8  # Weighted fraction of joints that must match
+
+
+def build_hand_windows(ref_motion, window=30, xy_axes=(0, 1)):
+    """
+    Precompute, for every reference frame, the 2D hand positions a spectator's
+    hands can match: the last `window` + 1 frames of the same hand plus the
+    mirrored positions of the opposite hand.
+
+    Parameters:
+        ref_motion (np.ndarray): Reference sequence of shape (n_frames, n_joints, 3).
+        window (int): Number of past reference frames included in each window.
+        xy_axes (list): Axes of the reference used as the 2D plane.
+
+    Returns:
+        np.ndarray: Array of shape (n_frames, 2, 2 * (window + 1), 2). Axis 1 is
+                    the side (0 = left hand, 1 = right hand), so that
+                    `hand_windows[ref_frame_idx]` is an O(1) lookup.
+    """
+    return build_joint_windows(ref_motion, HANDS_IDX, window, xy_axes)
+
+
+def build_joint_windows(ref_motion, joint_indices, window=30, xy_axes=(0, 1), dtype=None):
+    """
+    Precompute, for every reference frame, the 2D positions each joint can
+    match: the last `window` + 1 frames of the same joint plus the mirrored
+    positions of the joint on the other side of the body.
+
+    Parameters:
+        ref_motion (np.ndarray): Reference sequence of shape (n_frames, n_joints, 3).
+        joint_indices (list): Indices of the scored joints.
+        window (int): Number of past reference frames included in each window.
+        xy_axes (list): Axes of the reference used as the 2D plane.
+        dtype (np.dtype, optional): Type of the windows, e.g. np.float32 to halve
+                                    their memory for many joints.
+
+    Returns:
+        np.ndarray: Array of shape (n_frames, n_scored_joints, 2 * (window + 1), 2).
+    """
+    joint_indices = list(joint_indices)
+    mirrored_indices = [MIRRORED_JOINTS_IDX[i] for i in joint_indices]
+    joints = ref_motion[:, joint_indices][:, :, list(xy_axes)]  # (n_frames, n, 2)
+    mirrored = ref_motion[:, mirrored_indices][:, :, list(xy_axes)]
+    mirrored[..., 0] = -mirrored[..., 0]  # Invert the x-axis
+
+    # Repeat the first frame so that early frames have a full window, this does
+    # not change the result of an "any point is close" test
+    candidates = np.concatenate((joints, mirrored), axis=-1)  # (n_frames, n, 4)
+    if dtype is not None:
+        candidates = candidates.astype(dtype, copy=False)
+    padded = np.concatenate(
+        (np.repeat(candidates[:1], window, axis=0), candidates), axis=0
+    )
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window + 1, axis=0)
+    # (n_frames, n, 4, window + 1) -> (n_frames, n, 2 * (window + 1), 2)
+    n_frames, n_joints = windows.shape[:2]
+    windows = windows.reshape((n_frames, n_joints, 2, 2, window + 1))
+    windows = windows.transpose(0, 1, 2, 4, 3)
+    return np.ascontiguousarray(
+        windows.reshape(n_frames, n_joints, 2 * (window + 1), 2)
+    )
+
+
+def hands_close(hand_positions, hand_windows, threshold):
+    """
+    Check if each hand is close to any position of its reference window.
+
+    Parameters:
+        hand_positions (np.ndarray): 2D hand positions, shape (..., 2, 2).
+        hand_windows (np.ndarray): Windows from `build_hand_windows`, indexed by
+                                   frame, shape (..., 2, n_points, 2).
+        threshold (float or np.ndarray): Distance threshold, broadcastable to (...).
+
+    Returns:
+        np.ndarray: Boolean array of shape (..., 2), one value per hand.
+    """
+    diff = hand_windows - hand_positions[..., np.newaxis, :]
+    squared_distances = np.einsum("...i,...i->...", diff, diff)
+    threshold = np.asarray(threshold)[..., np.newaxis, np.newaxis]
+    return np.any(squared_distances < threshold**2, axis=-1)
+
+
+def joints_close(joint_positions, joint_windows, thresholds):
+    """
+    Check if each joint is close to any position of its reference window, with
+    a threshold per joint.
+
+    Parameters:
+        joint_positions (np.ndarray): 2D joint positions, shape (..., n, 2).
+        joint_windows (np.ndarray): Windows from `build_joint_windows`, indexed
+                                    by frame, shape (..., n, n_points, 2).
+        thresholds (np.ndarray): Distance thresholds, broadcastable to (..., n).
+
+    Returns:
+        np.ndarray: Boolean array of shape (..., n), one value per joint.
+    """
+    diff = joint_windows - joint_positions[..., np.newaxis, :]
+    squared_distances = np.einsum("...i,...i->...", diff, diff)
+    thresholds = np.asarray(thresholds)[..., np.newaxis]
+    return np.any(squared_distances < thresholds**2, axis=-1)
+
+
+class JointScorer:
+    """
+    Score a spectator against the reference on any subset of joints, all joints
+    and all spectators of a batch in a single broadcast.
+
+    Each joint matches if it is close to its reference window (see
+    `build_joint_windows`). Its threshold is the level threshold of the frame
+    scaled by the factor of its segment (`LIMBS`). The score is the weighted
+    fraction of matching joints, the frame is valid if the score reaches
+    `pass_ratio`. With the hands only, unit weights and a ratio of 1, this is
+    the original hands test.
+    """
+
+    def __init__(self, joints, weights=None, segment_scales=None, pass_ratio=1.0):
+        """
+        Parameters:
+            joints (list): Names of the scored joints.
+            weights (dict, optional): Weight of each joint name, 1 by default.
+            segment_scales (dict, optional): Threshold factor of each segment of
+                                             `LIMBS`, 1 by default.
+            pass_ratio (float): Minimum weighted fraction of matching joints.
+        """
+        weights = weights or {}
+        segment_scales = segment_scales or {}
+        joint_segments = {
+            joint: segment for segment, names in LIMBS.items() for joint in names
+        }
+
+        self.joints = list(joints)
+        self.joint_indices = np.array([JOINTS_NAMES_TO_IDX[j] for j in self.joints])
+        self.weights = np.array([weights.get(j, 1.0) for j in self.joints])
+        self.weights = self.weights / self.weights.sum()
+        self.scales = np.array(
+            [segment_scales.get(joint_segments[j], 1.0) for j in self.joints]
+        )
+        self.pass_ratio = pass_ratio
+
+    def build_windows(self, ref_motion, window=30, xy_axes=(0, 1), dtype=None):
+        """Windows of the scored joints for every reference frame, see `build_joint_windows`."""
+        return build_joint_windows(
+            ref_motion, self.joint_indices, window, xy_axes, dtype=dtype
+        )
+
+    def score(self, spectator_frames, joint_windows, thresholds):
+        """
+        Parameters:
+            spectator_frames (np.ndarray): 2D skeletons, shape (..., n_joints, 2).
+            joint_windows (np.ndarray): Windows of the reference frames, shape
+                                        (..., n_scored_joints, n_points, 2).
+            thresholds (float or np.ndarray): Level thresholds, broadcastable to (...).
+
+        Returns:
+            tuple: (valid, scores, matched) with `valid` and `scores` of shape
+                   (...), and `matched` the per-joint results, shape (..., n_scored_joints).
+        """
+        joint_thresholds = np.asarray(thresholds)[..., np.newaxis] * self.scales
+        matched = joints_close(
+            spectator_frames[..., self.joint_indices, :], joint_windows, joint_thresholds
+        )
+        scores = matched @ self.weights
+        # Tolerate rounding of the weighted sum when all joints must match
+        return scores >= self.pass_ratio - 1e-9, scores, matched
+
+
+def build_full_body_scorer():
+    """Scorer of the full-body mode, with the FULL_BODY_* joints, weights and scales."""
+    return JointScorer(
+        FULL_BODY_JOINTS,
+        FULL_BODY_WEIGHTS,
+        FULL_BODY_SEGMENT_SCALES,
+        FULL_BODY_PASS_RATIO,
+    )
 
 
 def angle_between_points(A, B, C):
@@ -25,15 +221,64 @@ def angle_between_points(A, B, C):
 def are_angles_close(current_angles, ref_angles_history, tolerance):
     """
     Compare current angles to all angles in ref_angles_history (last second of reference data).
-    Returns True if any angle in the current frame is within tolerance for any reference frame.
+    Returns True if all angles of the current frame are within tolerance of the
+    angles of any reference frame.
+    """
+    matched, _ = match_angles(current_angles, ref_angles_history, tolerance)
+    return bool(matched)
+
+
+def angle_difference(angles, other_angles):
+    """Absolute difference between angles in degrees, wrapping around 360, in [0, 180]."""
+    return np.abs((np.asarray(angles) - other_angles + 180) % 360 - 180)
+
+
+def match_angles(current_angles, ref_angles_history, tolerance):
+    """
+    Compare current angles to every frame of a reference window in a single
+    broadcast, and find the reference frame that matches best.
+
+    Parameters:
+        current_angles (np.ndarray): Angles of shape (..., num_angles).
+        ref_angles_history (np.ndarray): Reference angles of the window, oldest
+                                         first, shape (..., window, num_angles).
+        tolerance (float or np.ndarray): Tolerance in degrees, for all angles or
+                                         one per angle.
+
+    Returns:
+        tuple: (matched, offset) arrays of shape (...). `matched` is True if all
+               angles are within tolerance for some reference frame, `offset`
+               is the number of frames between the best matching reference frame
+               and the last one of the window, i.e. the lag of the spectator.
+    """
+    deviations = angle_difference(
+        ref_angles_history, np.asarray(current_angles)[..., np.newaxis, :]
+    )
+    # Worst angle of each reference frame, relative to its tolerance
+    excess = np.max(deviations - tolerance, axis=-1)
+
+    # Most recent frames first, so that ties favor the smallest lag
+    offset = np.argmin(excess[..., ::-1], axis=-1)
+    matched = np.min(excess, axis=-1) <= 0
+    return matched, offset
+
+
+def build_angle_windows(ref_angles, window=30):
+    """
+    Windows of the last `window` + 1 reference angles for every frame, as a view
+    (no copy) of shape (num_frames, window + 1, num_angles), oldest first. The
+    first frame is repeated for early frames.
     """
-    for ref_angles in ref_angles_history:
-        if np.all(np.abs(current_angles - ref_angles) <= tolerance):
-            return True
-    return False
+    padded = np.concatenate(
+        (np.repeat(ref_angles[:1], window, axis=0), ref_angles), axis=0
+    )
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window + 1, axis=0)
+    return windows.transpose(0, 2, 1)
 
 
-def compute_energy_of_ref_file(motion_frames):
+def compute_energy_of_ref_file(
+    motion_frames, per_joint=False, per_limb=False, dtype=None
+):
     """
     Given a temporal dictionary of motion frames, compute the "energy" for each
     sequence in the dictionary. The energy is the absolute value of the
@@ -43,77 +288,219 @@ def compute_energy_of_ref_file(motion_frames):
         motion_frames (dict): A dictionary where keys are sequence names
                               (e.g., "choreography") and values are numpy arrays
                               of shape (num_frames, num_joints, 3).
+        per_joint (bool): Compute the energy of each joint separately.
+        per_limb (bool): Compute the energy of each limb of `LIMBS` separately.
+        dtype (np.dtype): Floating point type of the computation (e.g. np.float32).
 
     Returns:
         dict: A dictionary where keys are sequence names and values are
-              1D numpy arrays representing the energy for each frame.
+              1D numpy arrays representing the energy for each frame, 2D arrays
+              (num_frames, num_joints) if `per_joint`, or dictionaries of 1D
+              arrays by limb name if `per_limb`.
     """
     ref_energy = {}
-
     for key, values in motion_frames.items():
-        num_frames = values.shape[0]
-        energy = np.zeros(num_frames)
+        if per_limb:
+            ref_energy[key] = compute_limb_energy(values, dtype=dtype)
+        else:
+            ref_energy[key] = compute_energy(values, per_joint=per_joint, dtype=dtype)
+    return ref_energy
 
-        for i in range(1, num_frames - 1):
-            prev_frame = values[i - 1]
-            curr_frame = values[i]
-            next_frame = values[i + 1]
 
-            # Compute the acceleration as the difference in velocity
-            velocity1 = curr_frame - prev_frame
-            velocity2 = next_frame - curr_frame
-            acceleration = velocity2 - velocity1
+def compute_energy(motion_frames, per_joint=False, dtype=None):
+    """
+    Compute the energy of a sequence: the squared mean absolute acceleration
+    (second difference) of the joints, for each frame. The first and last
+    frames have no acceleration and an energy of 0.
 
-            # Sum the absolute value of the acceleration for all joints and square it
-            energy[i] = np.mean(np.abs(acceleration)) ** 2
+    Parameters:
+        motion_frames (np.ndarray): Sequence of shape (num_frames, num_joints, d).
+        per_joint (bool): Average over the coordinates of each joint only.
+        dtype (np.dtype): Floating point type of the computation.
 
-        # Store the energy array for the current sequence
-        ref_energy[key] = energy
-    return ref_energy
+    Returns:
+        np.ndarray: Energy of shape (num_frames,), or (num_frames, num_joints)
+                    if `per_joint`.
+    """
+    motion_frames = np.asarray(motion_frames, dtype=dtype)
+    acceleration = np.abs(np.diff(motion_frames, n=2, axis=0))
+    if per_joint:
+        shape, axis = motion_frames.shape[:2], -1
+    else:
+        shape, axis = motion_frames.shape[:1], (-2, -1)
 
+    energy = np.zeros(shape, dtype=acceleration.dtype)
+    energy[1:-1] = np.mean(acceleration, axis=axis) ** 2
+    return energy
 
-def compute_angles(motion_frames, angle_indices):
+
+def compute_limb_energy(motion_frames, limbs=LIMBS, dtype=None):
     """
-    motion_frames shape ()
-    angle_indices list of Tuples of 3 indices that make the angles we want to monitor
+    Compute the energy of a sequence for each limb.
+
+    Parameters:
+        motion_frames (np.ndarray): Sequence of shape (num_frames, num_joints, d).
+        limbs (dict): Names of the joints of each limb, by limb name.
+        dtype (np.dtype): Floating point type of the computation.
+
+    Returns:
+        dict: Energy of shape (num_frames,) by limb name.
     """
-    angles = np.zeros((motion_frames.shape[0], len(angle_indices)))
-    for i in range(len(motion_frames)):
-        for j, (A_idx, B_idx, C_idx) in enumerate(angle_indices):
-            A = motion_frames[i][A_idx]
-            B = motion_frames[i][B_idx]
-            C = motion_frames[i][C_idx]
-            angles[i][j] = angle_between_points(A, B, C)
-    return angles
+    motion_frames = np.asarray(motion_frames, dtype=dtype)
+    acceleration = np.abs(np.diff(motion_frames, n=2, axis=0))
+    joints_acceleration = np.mean(acceleration, axis=-1)
 
+    limbs_energy = {}
+    for limb, joints in limbs.items():
+        joints_idx = [JOINTS_NAMES_TO_IDX[joint] for joint in joints]
+        energy = np.zeros(motion_frames.shape[0], dtype=acceleration.dtype)
+        energy[1:-1] = np.mean(joints_acceleration[:, joints_idx], axis=-1) ** 2
+        limbs_energy[limb] = energy
+    return limbs_energy
 
-def majority_voting(results):
+
+def trailing_mean(values, window):
     """
-    Apply majority voting over the results list (booleans).
-    Returns True if more than half the results are True.
+    Mean of the last `window` values (fewer for the first ones) for each frame,
+    as computed live by `EnergyTracker`.
     """
-    return sum(results) > len(results) // 2
+    cumulative = np.cumsum(values, axis=0)
+    totals = cumulative.copy()
+    totals[window:] -= cumulative[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return totals / counts.reshape((-1,) + (1,) * (totals.ndim - 1))
+
+
+class EnergyTracker:
+    """
+    Live version of `compute_energy` with an O(1) update per frame.
+
+    The last three frames are kept in a ring buffer to compute the acceleration,
+    and running sums give the mean and variance of the energy over the last
+    `window` frames.
+    """
+
+    def __init__(self, window=30):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._frames = None  # Ring buffer of the last three frames
+        self._n_frames = 0
+        self._energies = np.zeros(self.window)  # Ring buffer of the last energies
+        self._n_energies = 0
+        self._sum = 0.0
+        self._sum_squares = 0.0
 
+    def restart_frames(self):
+        """
+        Forget the last frames but keep the energies of the window, when frames
+        are missing: an acceleration across the gap would be inflated.
+        """
+        self._n_frames = 0
 
-# def compute_hands_energy(skeleton, prev_frame, prev_velocity):
-#     """Compute energy for the left and right hands."""
-#     left_hand = skeleton[JOINTS_NAMES_TO_IDX["LeftHand"]]
-#     right_hand = skeleton[JOINTS_NAMES_TO_IDX["RightHand"]]
+    def update(self, frame):
+        """
+        Add a frame and return the energy of the previous one, whose acceleration
+        is now known (0 until three frames were added).
 
-#     # Compute velocity (change in position)
-#     left_hand_velocity = left_hand - prev_frame[JOINTS_NAMES_TO_IDX["LeftHand"]]
-#     right_hand_velocity = right_hand - prev_frame[JOINTS_NAMES_TO_IDX["RightHand"]]
+        Parameters:
+            frame (np.ndarray): Normalized skeleton of shape (num_joints, d).
 
-#     # Compute acceleration (change in velocity)
-#     left_hand_acceleration = left_hand_velocity - prev_velocity["left"]
-#     right_hand_acceleration = right_hand_velocity - prev_velocity["right"]
+        Returns:
+            float: Energy of the previous frame.
+        """
+        if self._frames is None:
+            self._frames = np.empty((3,) + frame.shape)
+        self._frames[self._n_frames % 3] = frame
+        self._n_frames += 1
+        if self._n_frames < 3:
+            return 0.0
 
-#     # Compute energy as the sum of squared velocities and accelerations
-#     left_hand_energy = np.sum(left_hand_velocity**2 + left_hand_acceleration**2)
-#     right_hand_energy = np.sum(right_hand_velocity**2 + right_hand_acceleration**2)
+        previous_frame = self._frames[(self._n_frames - 3) % 3]
+        current_frame = self._frames[(self._n_frames - 2) % 3]
+        next_frame = self._frames[(self._n_frames - 1) % 3]
+        acceleration = next_frame - 2 * current_frame + previous_frame
+        energy = float(np.mean(np.abs(acceleration)) ** 2)
 
-#     # Update previous frame and velocity
-#     prev_velocity["left"] = left_hand_velocity
-#     prev_velocity["right"] = right_hand_velocity
+        # Replace the oldest energy of the window in the running sums
+        slot = self._n_energies % self.window
+        if self._n_energies >= self.window:
+            oldest = self._energies[slot]
+            self._sum -= oldest
+            self._sum_squares -= oldest**2
+        self._energies[slot] = energy
+        self._sum += energy
+        self._sum_squares += energy**2
+        self._n_energies += 1
+        return energy
 
-#     return left_hand_energy, right_hand_energy
+    @property
+    def mean(self):
+        """Mean energy over the window."""
+        n = min(self._n_energies, self.window)
+        return self._sum / n if n else 0.0
+
+    @property
+    def variance(self):
+        """Variance of the energy over the window."""
+        n = min(self._n_energies, self.window)
+        if not n:
+            return 0.0
+        return max(self._sum_squares / n - self.mean**2, 0.0)
+
+
+def compute_angles(motion_frames, angle_indices):
+    """
+    Compute the angles ABC, in degrees in [0, 360), of all frames and joint
+    triplets at once, in the plane of the first two coordinates.
+
+    Parameters:
+        motion_frames (np.ndarray): Positions of shape (num_frames, num_joints, 2 or 3),
+                                    or a single frame (num_joints, 2 or 3).
+        angle_indices (array-like): Triplets (A, B, C) of joint indices, e.g. from
+                                    `utils.convert_angles_names_to_idx`.
+
+    Returns:
+        np.ndarray: Angles of shape (num_frames, num_angles), or (num_angles,)
+                    for a single frame.
+    """
+    angle_indices = np.asarray(angle_indices).reshape(-1, 3)
+    points = motion_frames[..., angle_indices, :2]  # (..., num_angles, 3, 2)
+
+    # Vectors BA and BC, and their directions with a single atan2
+    vectors = points[..., [0, 2], :] - points[..., 1:2, :]
+    directions = np.arctan2(vectors[..., 1], vectors[..., 0])
+
+    angles = np.degrees(directions[..., 1] - directions[..., 0])
+    # Normalize the angle to the range [0, 360)
+    return (angles + 360) % 360
+
+
+def compute_reference_angles(ref_motion, angle_indices, xy_axes=(0, 1)):
+    """
+    Compute the angles of every frame of the reference motions once, so that
+    live scoring only has to index them.
+
+    Parameters:
+        ref_motion (dict): Reference sequences (num_frames, num_joints, 3) by level.
+        angle_indices (array-like): Triplets (A, B, C) of joint indices.
+        xy_axes (list): Axes of the reference used as the 2D plane.
+
+    Returns:
+        dict: float32 angles of shape (num_frames, num_angles) by level.
+    """
+    return {
+        level: compute_angles(motion[:, :, list(xy_axes)], angle_indices).astype(
+            np.float32
+        )
+        for level, motion in ref_motion.items()
+    }
+
+
+def majority_voting(results):
+    """
+    Apply majority voting over the results list (booleans).
+    Returns True if more than half the results are True.
+    """
+    return sum(results) > len(results) // 2
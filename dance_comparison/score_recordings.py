@@ -0,0 +1,311 @@
+"""
+Score recorded sessions offline with the same logic as the live server, for
+instance to re-grade the visitors of a day after tuning the thresholds.
+
+Recordings are the folders written by `main_recording` (or its former .npy
+files). Frames are compared to the reference frame of their recorded frame
+number, to `start + i` for recordings without frame numbers, or to the frame
+estimated by online DTW with --align. --from-raw normalizes and projects the
+raw 3D skeletons again instead of using the recorded 2D frames, --full-body
+scores all the joints as main.py --full-body. Usage from the root folder:
+
+    python dance_comparison/score_recordings.py recordings/* --level choreography
+    python dance_comparison/score_recordings.py recordings/* --align --output scores/
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from alignment import OnlineAligner
+from levels import LevelRegistry
+from recorder import load_recording_columns
+from score import HANDS_IDX, build_full_body_scorer, build_hand_windows, hands_close
+from skeleton_utils import JOINTS_NAMES_TO_IDX, normalize_skeleton
+from thresholds import THRESHOLD_PROFILES_DIR, build_thresholds
+from utils import extract_ref_motion_data, get_orthogonal_indices
+
+REFERENCE_XY_AXES = [0, 1]
+LEVELS_DIR = "."  # Folder of the BVH references, one level each (from root folder)
+HAND_WINDOW = 30  # Number of past reference frames the hands can match
+ALIGN_BAND = 60  # Half-width of the DTW band, see `alignment.OnlineAligner`
+
+# Reference data of each (level, window, profiles, levels, full body), loaded once
+# per process
+_REFERENCES = {}
+
+
+def load_reference(
+    level,
+    window=HAND_WINDOW,
+    profiles_dir=THRESHOLD_PROFILES_DIR,
+    levels_dir=LEVELS_DIR,
+    full_body=False,
+):
+    """
+    Load the reference data needed to score a level: 2D reference frames, hand
+    windows (or the scorer and joint windows of the full-body mode, as main.py
+    --full-body) and thresholds, cached for the lifetime of the process.
+    """
+    key = (level, window, profiles_dir, levels_dir, full_body)
+    if key not in _REFERENCES:
+        fname = LevelRegistry(levels_dir).discover()[level]
+        ref_motion = extract_ref_motion_data(fname, normalize=True)
+        reference = {
+            "frames": np.ascontiguousarray(
+                ref_motion[:, :, REFERENCE_XY_AXES], dtype=np.float32
+            ),
+            "thresholds": build_thresholds({level: ref_motion}, profiles_dir)[level],
+        }
+        if full_body:
+            reference["scorer"] = build_full_body_scorer()
+            reference["joint_windows"] = reference["scorer"].build_windows(
+                ref_motion, window, REFERENCE_XY_AXES, np.float32
+            )
+        else:
+            reference["hand_windows"] = build_hand_windows(
+                ref_motion, window, REFERENCE_XY_AXES
+            )
+        _REFERENCES[key] = reference
+    return _REFERENCES[key]
+
+
+def project_frames(raw_frames, xy_axes=None):
+    """
+    Normalize raw 3D spectator frames and project them in 2D, as the live server.
+
+    Parameters:
+        raw_frames (np.ndarray): Frames of shape (n_frames, n_joints, 3) as received.
+        xy_axes (list): Calibration axes, computed from the first frame if None.
+
+    Returns:
+        np.ndarray: 2D frames of shape (n_frames, n_joints, 2).
+    """
+    if xy_axes is None:
+        first_frame = raw_frames[0]
+        xy_axes = get_orthogonal_indices(
+            first_frame[JOINTS_NAMES_TO_IDX["LeftShoulder"]],
+            first_frame[JOINTS_NAMES_TO_IDX["RightShoulder"]],
+            first_frame[JOINTS_NAMES_TO_IDX["Neck"]],
+            first_frame[JOINTS_NAMES_TO_IDX["Hips"]],
+        )
+    frames = normalize_skeleton(np.asarray(raw_frames, dtype=float))[:, :, list(xy_axes)]
+    frames[:, :, 0] *= -1  # Flip x-axis
+    return frames
+
+
+def score_sequence(frames, reference, ref_frame_indices):
+    """
+    Score a whole sequence of spectator frames in one broadcast, as the live
+    server scores each frame.
+
+    Parameters:
+        frames (np.ndarray): Normalized 2D spectator frames, shape (n_frames, n_joints, 2).
+        reference (dict): Reference data from `load_reference`.
+        ref_frame_indices (np.ndarray): Reference frame of each spectator frame.
+
+    Returns:
+        dict: Per-frame arrays "ref_frame", "scored" (the reference frame exists),
+              "hands_up" (frames with both hands down are ignored), "threshold"
+              and "valid", and "score" (weighted fraction of matching joints)
+              for full-body references.
+    """
+    ref_frame_indices = np.asarray(ref_frame_indices, dtype=int)
+    scored = (ref_frame_indices >= 0) & (ref_frame_indices < len(reference["thresholds"]))
+    indices = np.clip(ref_frame_indices, 0, len(reference["thresholds"]) - 1)
+
+    hand_positions = frames[:, HANDS_IDX]
+    hands_up = np.any(hand_positions[:, :, 1] > 0.25, axis=1)
+    thresholds = reference["thresholds"][indices]
+    results = {
+        "ref_frame": ref_frame_indices,
+        "scored": scored,
+        "hands_up": hands_up,
+        "threshold": thresholds,
+    }
+    if "scorer" in reference:
+        valid, results["score"], _ = reference["scorer"].score(
+            frames, reference["joint_windows"][indices], thresholds
+        )
+    else:
+        valid = np.all(
+            hands_close(hand_positions, reference["hand_windows"][indices], thresholds),
+            axis=1,
+        )
+    results["valid"] = valid & scored & hands_up
+    return results
+
+
+def summarize(results):
+    """Counts and ratio of valid frames among the frames that were scored."""
+    counted = results["scored"] & results["hands_up"]
+    n_counted = int(counted.sum())
+    n_valid = int(results["valid"].sum())
+    return {
+        "frames": len(results["valid"]),
+        "ignored": int(len(counted) - n_counted),
+        "valid": n_valid,
+        "ratio": n_valid / n_counted if n_counted else 0.0,
+    }
+
+
+def score_recording(
+    fname,
+    level="choreography",
+    start=None,
+    window=HAND_WINDOW,
+    align=False,
+    from_raw=False,
+    profiles_dir=THRESHOLD_PROFILES_DIR,
+    levels_dir=LEVELS_DIR,
+    full_body=False,
+):
+    """
+    Score one recording.
+
+    Parameters:
+        fname (str): Recording, see `recorder.load_recording`.
+        level (str): Level the spectator danced.
+        start (int): Reference frame of the first recorded frame, replaces the
+                     recorded frame numbers. Defaults to the frame numbers, or
+                     to 0 if the recording has none.
+        window (int): Number of past reference frames the hands can match.
+        align (bool): Estimate the reference frames by online DTW.
+        from_raw (bool): Process the raw 3D frames again instead of using the
+                         recorded 2D frames.
+        profiles_dir (str): Folder of the threshold profiles.
+        levels_dir (str): Folder of the BVH references.
+        full_body (bool): Score the joints of the full-body mode instead of the
+                          hands only, as main.py --full-body.
+
+    Returns:
+        tuple: (results, summary), see `score_sequence` and `summarize`.
+    """
+    reference = load_reference(level, window, profiles_dir, levels_dir, full_body)
+    columns, metadata = load_recording_columns(fname)
+    if from_raw:
+        frames = project_frames(columns["raw"], metadata.get("xy_axes"))
+    else:
+        frames = columns["frames"]
+
+    if start is None and "frame_number" in columns:
+        ref_frame_indices = columns["frame_number"].astype(int)
+    else:
+        ref_frame_indices = (start or 0) + np.arange(len(frames))
+    if align:
+        aligner = OnlineAligner(reference["frames"], ALIGN_BAND)
+        ref_frame_indices = np.array(
+            [aligner.update(frame, hint=idx) for frame, idx in zip(frames, ref_frame_indices)],
+            dtype=int,
+        )
+    results = score_sequence(frames, reference, ref_frame_indices)
+    return results, summarize(results)
+
+
+def score_recordings(fnames, jobs=None, **kwargs):
+    """
+    Score many recordings in parallel, one process per file.
+
+    Parameters:
+        fnames (list): Recordings to score.
+        jobs (int): Number of processes, defaults to the number of CPUs.
+        **kwargs: Arguments of `score_recording`.
+
+    Returns:
+        dict: (results, summary) of each file name.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            fname: executor.submit(score_recording, fname, **kwargs) for fname in fnames
+        }
+        return {fname: future.result() for fname, future in futures.items()}
+
+
+def save_results(results, fname):
+    """Write the per-frame results to a CSV file."""
+    with open(fname, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame"] + list(results))
+        for i, row in enumerate(zip(*results.values())):
+            writer.writerow([i] + [value.item() for value in row])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("recordings", nargs="+", help="Recordings to score.")
+    parser.add_argument("--level", default="choreography", help="Name of the level.")
+    parser.add_argument(
+        "--levels-dir",
+        default=LEVELS_DIR,
+        help="Folder of the BVH references, one level per file.",
+    )
+    parser.add_argument(
+        "--start",
+        type=int,
+        help="Reference frame of the first recorded frame, instead of the recorded "
+        "frame numbers.",
+    )
+    parser.add_argument(
+        "--hand-window",
+        type=int,
+        default=HAND_WINDOW,
+        help="Number of past reference frames the hands can match.",
+    )
+    parser.add_argument(
+        "--align",
+        action="store_true",
+        help="Estimate the reference frame of each recorded frame by online DTW.",
+    )
+    parser.add_argument(
+        "--full-body",
+        action="store_true",
+        help="Score the full-body joints with their weights and segment thresholds, "
+        "as main.py --full-body.",
+    )
+    parser.add_argument(
+        "--from-raw",
+        action="store_true",
+        help="Normalize and project the recorded raw 3D frames again.",
+    )
+    parser.add_argument(
+        "--threshold-profiles",
+        default=THRESHOLD_PROFILES_DIR,
+        help="Folder of the threshold profiles, one <level>.json per level.",
+    )
+    parser.add_argument("--jobs", type=int, help="Number of processes.")
+    parser.add_argument(
+        "--output", help="Folder in which the per-frame results are saved as CSV."
+    )
+    args = parser.parse_args()
+
+    scores = score_recordings(
+        args.recordings,
+        jobs=args.jobs,
+        level=args.level,
+        start=args.start,
+        window=args.hand_window,
+        align=args.align,
+        from_raw=args.from_raw,
+        full_body=args.full_body,
+        profiles_dir=args.threshold_profiles,
+        levels_dir=args.levels_dir,
+    )
+
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+    print(f"{'recording':40s} {'frames':>7s} {'ignored':>8s} {'valid':>6s} {'ratio':>6s}")
+    for fname, (results, summary) in scores.items():
+        print(
+            f"{os.path.basename(os.path.normpath(fname)):40s} {summary['frames']:7d} "
+            f"{summary['ignored']:8d} {summary['valid']:6d} {summary['ratio']:6.1%}"
+        )
+        if args.output is not None:
+            stem = os.path.splitext(os.path.basename(os.path.normpath(fname)))[0]
+            save_results(results, os.path.join(args.output, f"{stem}_scores.csv"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# Ingestion of frames through a shared-memory ring, for capture tools running on
+# the same machine as the scoring server
+import os
+import platform
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+SHM_NAME = "dance_comparison_frames"
+SHM_MAGIC = 0x44414E43  # "DANC", checked by the producers
+SHM_HEADER_SIZE = 64  # magic, n_slots, n_joints, write count, padded to a cache line
+
+# Machines whose stores are seen in order by other cores (total store order)
+SHM_ORDERED_MACHINES = {"x86_64", "amd64", "i386", "i686", "x86"}
+
+_MAGIC, _N_SLOTS, _N_JOINTS, _WRITE_COUNT = range(4)
+
+
+def slot_dtype(n_joints):
+    """
+    Layout of a slot of the ring: sequence number, frame number, source id and
+    the joint coordinates as float32.
+    """
+    return np.dtype(
+        [
+            ("seq", "<i8"),
+            ("frame_number", "<i8"),
+            ("source", "<i8"),
+            ("joints", "<f4", (n_joints, 3)),
+        ]
+    )
+
+
+def _map_ring(shm):
+    header = np.ndarray(SHM_HEADER_SIZE // 8, dtype="<i8", buffer=shm.buf)
+    n_slots, n_joints = int(header[_N_SLOTS]), int(header[_N_JOINTS])
+    slots = np.ndarray(
+        n_slots, dtype=slot_dtype(n_joints), buffer=shm.buf, offset=SHM_HEADER_SIZE
+    )
+    return header, slots
+
+
+class ShmFrameConsumer:
+    """
+    Reading end of the ring, owned by the scoring server: it creates the shared
+    memory and removes it when closed.
+
+    The ring holds the `n_slots` newest frames. Each slot is guarded by a
+    sequence lock: the producer makes the sequence number odd while writing
+    frame k, then sets it to 2k + 2, and a read is only kept if the sequence
+    number is the expected one before and after copying. A consumer that falls
+    more than `n_slots` frames behind skips to the oldest frame still in the
+    ring, so the latency stays bounded. Frames are read with `poll`, or by a
+    background thread between `start` and `stop`.
+
+    Writes are ordered as issued on x86 (total store order), which the sequence
+    lock relies on: other machines are refused.
+    """
+
+    def __init__(self, name=SHM_NAME, n_slots=256, n_joints=33, replace=False):
+        """
+        Parameters:
+            name (str): Name of the shared memory, shared with the producers.
+            n_slots (int): Number of frames the ring holds.
+            n_joints (int): Number of joints of a frame.
+            replace (bool): Remove an existing shared memory of the same name,
+                            left behind by a server that did not exit cleanly.
+                            Else another server may be using it, which raises
+                            a FileExistsError.
+        """
+        if platform.machine().lower() not in SHM_ORDERED_MACHINES:
+            raise RuntimeError(
+                "The shared-memory ring needs an x86 machine, not "
+                f"{platform.machine()}."
+            )
+        size = SHM_HEADER_SIZE + n_slots * slot_dtype(n_joints).itemsize
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            if not replace:
+                raise FileExistsError(
+                    f"The shared memory {name} exists, another server may be using "
+                    "it. Choose another name, or replace it if it was left behind."
+                ) from None
+            print(f"Warning: replacing the existing shared memory {name}.")
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+
+        header = np.ndarray(SHM_HEADER_SIZE // 8, dtype="<i8", buffer=self._shm.buf)
+        header[:] = 0
+        header[_N_SLOTS], header[_N_JOINTS] = n_slots, n_joints
+        self._header, self._slots = _map_ring(self._shm)
+        self._slots["seq"] = 0
+        # Written last, producers refuse the ring until then
+        self._header[_MAGIC] = SHM_MAGIC
+
+        self.name = name
+        self.stats = {"received": 0, "overrun": 0, "torn": 0}
+        self._read_count = 0
+        self._thread = None
+        self._running = False
+
+    def poll(self, handler, max_frames=None):
+        """
+        Pass on the frames written since the last call.
+
+        Parameters:
+            handler (callable): Called as handler(source, frame_number, joints)
+                                for each frame, with `joints` a float32 copy of
+                                shape (n_joints, 3).
+            max_frames (int): Maximum number of frames to read, all by default.
+
+        Returns:
+            int: Number of frames passed on.
+        """
+        write_count = int(self._header[_WRITE_COUNT])
+        n_slots = len(self._slots)
+        if write_count - self._read_count > n_slots:
+            self.stats["overrun"] += write_count - n_slots - self._read_count
+            self._read_count = write_count - n_slots
+
+        if max_frames is not None:
+            write_count = min(write_count, self._read_count + max_frames)
+
+        n_frames = 0
+        while self._read_count < write_count:
+            k = self._read_count
+            self._read_count += 1
+            slot = self._slots[k % n_slots]
+            expected = 2 * k + 2
+            if slot["seq"] != expected:
+                self.stats["torn"] += 1
+                continue
+            frame_number, source = int(slot["frame_number"]), int(slot["source"])
+            joints = slot["joints"].copy()
+            if slot["seq"] != expected:
+                # Overwritten while copying
+                self.stats["torn"] += 1
+                continue
+            self.stats["received"] += 1
+            n_frames += 1
+            handler(source, frame_number, joints)
+        return n_frames
+
+    def start(self, handler, poll_interval=0.0001):
+        """
+        Poll the ring from a background thread, see `poll`.
+
+        Parameters:
+            handler (callable): Called from the thread for each frame.
+            poll_interval (float): Sleep when the ring is empty (in seconds).
+        """
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, args=(handler, poll_interval), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self._header = self._slots = None
+        self._shm.close()
+        self._shm.unlink()
+
+    def _run(self, handler, poll_interval):
+        while self._running:
+            try:
+                if self.poll(handler) == 0:
+                    time.sleep(poll_interval)
+            except Exception as e:
+                print(f"Error reading shared-memory frames: {e}")
+
+
+class ShmFrameProducer:
+    """
+    Writing end of the ring, for capture tools and benchmarks. The scoring
+    server must be running with the same ring name. Only one producer may write
+    to a ring at a time, it can send the frames of several sources.
+
+        producer = ShmFrameProducer()
+        producer.send(joints, frame_number, source=0)
+    """
+
+    def __init__(self, name=SHM_NAME):
+        """
+        Parameters:
+            name (str): Name of the shared memory created by the server.
+        """
+        try:
+            self._shm = shared_memory.SharedMemory(name)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No shared memory {name}, is the server running with "
+                "--ingest-backend shm?"
+            ) from None
+        if os.name == "posix":
+            # The server owns the shared memory, do not remove it when this
+            # process exits (only POSIX tracks shared memory)
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        header = np.ndarray(SHM_HEADER_SIZE // 8, dtype="<i8", buffer=self._shm.buf)
+        if header[_MAGIC] != SHM_MAGIC:
+            self._shm.close()
+            raise ValueError(f"The shared memory {name} is not a frame ring.")
+        self._header, self._slots = _map_ring(self._shm)
+        self.n_joints = int(self._header[_N_JOINTS])
+        # Continue after the frames of a previous producer
+        self._write_count = int(self._header[_WRITE_COUNT])
+
+    def send(self, joints, frame_number, source=0):
+        """
+        Write a frame to the ring, never blocks.
+
+        Parameters:
+            joints (np.ndarray): Raw 3D skeleton of shape (n_joints, 3).
+            frame_number (int): Frame number, as the last argument of /data.
+            source (int): Spectator, as the suffix of /data<source> (0 for /data).
+        """
+        k = self._write_count
+        slot = self._slots[k % len(self._slots)]
+        slot["seq"] = 2 * k + 1
+        slot["frame_number"] = frame_number
+        slot["source"] = source
+        slot["joints"] = joints
+        slot["seq"] = 2 * k + 2
+        self._write_count = k + 1
+        self._header[_WRITE_COUNT] = self._write_count
+
+    def close(self):
+        self._header = self._slots = None
+        self._shm.close()
@@ -112,7 +112,57 @@ PARENTS = [
 ]
 
 
-def normalize_skeleton(skeleton):
+LIMBS = {
+    "torso": ["Hips", "Spine", "Spine1", "Spine2", "Neck"],
+    "head": ["Head", "Head_end_site"],
+    "left_arm": ["LeftShoulder", "LeftArm", "LeftForeArm", "LeftHand"],
+    "left_hand": [
+        "LeftHandIndex1",
+        "LeftHandIndex2",
+        "LeftHandIndex3",
+        "LeftHandIndex3_end_site",
+    ],
+    "right_arm": ["RightShoulder", "RightArm", "RightForeArm", "RightHand"],
+    "right_hand": [
+        "RightHandIndex1",
+        "RightHandIndex2",
+        "RightHandIndex3",
+        "RightHandIndex3_end_site",
+    ],
+    "left_leg": ["LeftUpLeg", "LeftLeg", "LeftFoot", "LeftToeBase", "LeftToeBase_end_site"],
+    "right_leg": [
+        "RightUpLeg",
+        "RightLeg",
+        "RightFoot",
+        "RightToeBase",
+        "RightToeBase_end_site",
+    ],
+}
+
+
+# Joint on the other side of the body, for each joint (itself for the spine and head)
+MIRRORED_JOINTS_IDX = [
+    JOINTS_NAMES_TO_IDX[
+        "Right" + name[len("Left") :]
+        if name.startswith("Left")
+        else "Left" + name[len("Right") :] if name.startswith("Right") else name
+    ]
+    for name in JOINTS_NAMES_TO_IDX
+]
+
+
+# Angles (A, B, C) monitored for angle-based scoring, B is the vertex
+ANGLES = [
+    ("LeftShoulder", "LeftArm", "LeftForeArm"),
+    ("LeftArm", "LeftForeArm", "LeftHand"),
+    ("RightShoulder", "RightArm", "RightForeArm"),
+    ("RightArm", "RightForeArm", "RightHand"),
+    ("LeftUpLeg", "LeftLeg", "LeftFoot"),
+    ("RightUpLeg", "RightLeg", "RightFoot"),
+]
+
+
+def normalize_skeleton(skeleton, out=None, dtype=None):
     """
     Normalize the skeleton for size and position. Supports both single frames
     and sequences of frames, as well as dictionaries of sequences.
@@ -123,6 +173,10 @@ def normalize_skeleton(skeleton):
             - A sequence of skeleton frames (shape: (n_frames, n_joints, 2) or
               (n_frames, n_joints, 3)).
             - A dictionary where keys are sequence names and values are sequences of frames.
+        out (np.ndarray, optional): Array with the same shape as `skeleton` in
+            which the result is written. Passing `skeleton` itself normalizes in place.
+        dtype (np.dtype, optional): Floating point type of the result (e.g. np.float32).
+            Defaults to the type of `out`, or to the type of `skeleton` if it is a float.
 
     Returns:
         np.ndarray or dict:
@@ -130,17 +184,24 @@ def normalize_skeleton(skeleton):
             - A dictionary with normalized skeleton sequences if input is a dictionary.
     """
     if isinstance(skeleton, dict):
+        if out is not None:
+            raise ValueError("out is not supported for dictionaries of sequences.")
         # If input is a dictionary, normalize each sequence
-        return {key: normalize_skeleton(value) for key, value in skeleton.items()}
+        return {
+            key: normalize_skeleton(value, dtype=dtype)
+            for key, value in skeleton.items()
+        }
 
     elif isinstance(skeleton, np.ndarray):
         if len(skeleton.shape) == 2:
             # Single frame: (n_joints, 2) or (n_joints, 3)
-            return _normalize_single_frame(skeleton)
+            if out is not None:
+                out = out[np.newaxis]
+            return _normalize_sequence(skeleton[np.newaxis], out, dtype)[0]
 
         elif len(skeleton.shape) == 3:
             # Sequence of frames: (n_frames, n_joints, 2) or (n_frames, n_joints, 3)
-            return np.array([_normalize_single_frame(frame) for frame in skeleton])
+            return _normalize_sequence(skeleton, out, dtype)
 
         else:
             raise ValueError(
@@ -151,26 +212,38 @@ def normalize_skeleton(skeleton):
         raise TypeError("Input must be a numpy array or a dictionary of numpy arrays.")
 
 
-def _normalize_single_frame(skeleton):
+def _normalize_sequence(skeleton, out=None, dtype=None):
     """
-    Normalize a single skeleton frame.
+    Normalize a sequence of skeleton frames, all frames at once.
 
     Parameters:
-        skeleton (np.ndarray): Skeleton frame (shape: (n_joints, 2) or (n_joints, 3)).
+        skeleton (np.ndarray): Skeleton frames (shape: (n_frames, n_joints, d)).
+        out (np.ndarray, optional): Output array, may be `skeleton` itself.
+        dtype (np.dtype, optional): Floating point type of the result.
 
     Returns:
-        np.ndarray: Normalized skeleton.
+        np.ndarray: Normalized skeleton frames.
     """
-    root = skeleton[JOINTS_NAMES_TO_IDX["Hips"]]
+    if out is None:
+        if dtype is None:
+            dtype = skeleton.dtype if skeleton.dtype.kind == "f" else np.float64
+        out = np.empty(skeleton.shape, dtype=dtype)
+    elif out.shape != skeleton.shape:
+        raise ValueError(
+            f"out has shape {out.shape}, expected {skeleton.shape} to match the skeleton."
+        )
+
+    # Copy the root first, `out` may share memory with `skeleton`
+    root = skeleton[:, JOINTS_NAMES_TO_IDX["Hips"], np.newaxis].astype(out.dtype)
 
     # Translate so that the root joint is at the origin
-    skeleton_translated = skeleton - root
+    np.subtract(skeleton, root, out=out, casting="same_kind")
 
     # Compute skeleton height (distance between root and farthest joint)
-    joint_distances = np.linalg.norm(skeleton_translated, axis=1)
-    skeleton_height = np.max(joint_distances)
+    squared_distances = np.einsum("fjd,fjd->fj", out, out)
+    skeleton_height = np.sqrt(np.max(squared_distances, axis=1))
 
     # Scale the skeleton to a standard size (e.g., height of 1)
-    skeleton_normalized = skeleton_translated / skeleton_height
+    np.divide(out, skeleton_height[:, np.newaxis, np.newaxis], out=out)
 
-    return skeleton_normalized
+    return out
@@ -0,0 +1,114 @@
+# Spatial index over reference trajectories for proximity queries in time windows
+import math
+
+import numpy as np
+
+from score import HANDS_IDX
+
+
+class TrajectoryGrid:
+    """
+    Uniform grid over 2D points tagged with a time (reference frame index).
+
+    Answers "is any point within `radius` of p with a time in [start, end]"
+    without scanning the whole time window: points are sorted by cell then by
+    time, so the points of a cell in a time range are contiguous and found with
+    a binary search. A query visits the cells overlapping the disk only.
+    """
+
+    def __init__(self, points, times, cell_size):
+        """
+        Parameters:
+            points (np.ndarray): Positions of shape (n_points, 2).
+            times (np.ndarray): Non-negative integer time of each point, shape (n_points,).
+            cell_size (float): Side of the cells, ideally the largest query radius.
+        """
+        self.cell_size = cell_size
+        cells = np.floor(points / cell_size).astype(np.int64)
+        self._origin = cells.min(axis=0)
+        cells -= self._origin
+        self._shape = cells.max(axis=0) + 1
+
+        # Sort by cell then time with a single composite key
+        times = np.asarray(times, dtype=np.int64)
+        self._n_times = int(times.max()) + 1
+        keys = (cells[:, 0] * self._shape[1] + cells[:, 1]) * self._n_times + times
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self.points = np.ascontiguousarray(points[order])
+
+    def any_within(self, point, radius, start, end):
+        """
+        Check if any point with a time in [start, end] is closer than `radius`
+        to `point`.
+        """
+        start, end = max(start, 0), min(end, self._n_times - 1)
+        if start > end:
+            return False
+
+        # Cells overlapping the disk
+        center = np.floor(np.asarray(point) / self.cell_size).astype(np.int64)
+        center -= self._origin
+        offsets = np.arange(-math.ceil(radius / self.cell_size), math.ceil(radius / self.cell_size) + 1)
+        ix = (center[0] + offsets)[:, np.newaxis]
+        iy = (center[1] + offsets)[np.newaxis, :]
+        inside = (ix >= 0) & (ix < self._shape[0]) & (iy >= 0) & (iy < self._shape[1])
+        cells = (ix * self._shape[1] + iy)[inside]
+
+        # Contiguous range of points in the time window of each cell
+        first = np.searchsorted(self._keys, cells * self._n_times + start, side="left")
+        last = np.searchsorted(self._keys, cells * self._n_times + end, side="right")
+        counts = last - first
+        total = counts.sum()
+        if total == 0:
+            return False
+        indices = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+        diff = self.points[indices] - point
+        return bool(np.any(np.einsum("ij,ij->i", diff, diff) < radius**2))
+
+
+def build_hand_grids(ref_motion, cell_size, xy_axes=(0, 1)):
+    """
+    Index the 2D trajectory of each hand of the reference, together with the
+    mirrored trajectory of the opposite hand, as in `score.build_hand_windows`.
+
+    Parameters:
+        ref_motion (np.ndarray): Reference sequence of shape (n_frames, n_joints, 3).
+        cell_size (float): Side of the grid cells.
+        xy_axes (list): Axes of the reference used as the 2D plane.
+
+    Returns:
+        list: Two TrajectoryGrid, for the left and the right hand.
+    """
+    hands = np.asarray(ref_motion[:, HANDS_IDX][:, :, list(xy_axes)])  # (n_frames, 2, 2)
+    mirrored = hands[:, ::-1].copy()
+    mirrored[..., 0] = -mirrored[..., 0]  # Invert the x-axis
+    times = np.arange(len(hands))
+
+    return [
+        TrajectoryGrid(
+            np.concatenate((hands[:, side], mirrored[:, side])),
+            np.concatenate((times, times)),
+            cell_size,
+        )
+        for side in range(2)
+    ]
+
+
+def hands_close_indexed(hand_positions, hand_grids, ref_frame_idx, window, threshold):
+    """
+    Same as `score.hands_close` for one spectator, using the hand grids: check
+    if each hand is close to a reference position of the last `window` frames.
+
+    Returns:
+        np.ndarray: Boolean array of shape (2,), one value per hand.
+    """
+    return np.array(
+        [
+            grid.any_within(
+                hand_positions[side], threshold, ref_frame_idx - window, ref_frame_idx
+            )
+            for side, grid in enumerate(hand_grids)
+        ]
+    )
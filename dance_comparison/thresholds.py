@@ -0,0 +1,67 @@
+# Distance thresholds of the hands for every frame of each level
+import json
+import os
+
+import numpy as np
+
+THRESHOLD_PROFILES_DIR = "./threshold_profiles"  # From the root folder
+DEFAULT_THRESHOLD_PROFILE = {"default": 0.1, "segments": []}  # Levels without profile
+
+
+def load_threshold_profile(fname):
+    """
+    Load a threshold profile, a JSON file of the form:
+
+        {
+            "default": 1.0,
+            "segments": [
+                {"name": "First movement (wave)", "start": 0, "end": 600, "value": 0.2},
+                {"name": "13", "start": 3030, "end": null, "value": 0.12}
+            ]
+        }
+
+    Segments are applied in order over the frames [start, end[, so a segment
+    overrides the ones before it. A null end goes to the last frame.
+    """
+    with open(fname) as f:
+        profile = json.load(f)
+    for segment in profile.get("segments", []):
+        if segment.get("end") is not None and segment["end"] < segment["start"]:
+            raise ValueError(f"Segment {segment} of {fname} ends before it starts.")
+    return profile
+
+
+def compile_thresholds(profile, n_frames):
+    """
+    Compile a threshold profile into a contiguous float32 array of shape
+    (n_frames,), so that the threshold of a frame is a single lookup.
+    """
+    thresholds = np.full(n_frames, profile.get("default", 1.0), dtype=np.float32)
+    for segment in profile.get("segments", []):
+        thresholds[segment["start"] : segment.get("end")] = segment["value"]
+    return thresholds
+
+
+def build_thresholds(ref_motion, profiles_dir=THRESHOLD_PROFILES_DIR):
+    """
+    Build the per-frame distance thresholds of each level from its profile,
+    `<profiles_dir>/<level>.json`, or from DEFAULT_THRESHOLD_PROFILE for a level
+    without profile.
+
+    Parameters:
+        ref_motion (dict): Reference sequences of the levels, by level name.
+        profiles_dir (str): Folder of the threshold profiles.
+
+    Returns:
+        dict: Thresholds of shape (n_frames,) for each level.
+    """
+    thresholds = {}
+    for level, motion in ref_motion.items():
+        fname = os.path.join(profiles_dir, f"{level}.json")
+        if os.path.exists(fname):
+            profile = load_threshold_profile(fname)
+        else:
+            print(f"Warning: no threshold profile {fname}, using the default thresholds.")
+            profile = DEFAULT_THRESHOLD_PROFILE
+        thresholds[level] = compile_thresholds(profile, len(motion))
+    return thresholds
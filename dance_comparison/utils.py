@@ -1,18 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
 import numpy as np
 
 from Motion import BVH
 from Motion.Animation import positions_global
-from skeleton_utils import JOINTS_NAMES_TO_IDX
+from skeleton_utils import JOINTS_NAMES_TO_IDX, normalize_skeleton
+
+MOTION_CACHE_DIR = ".motion_cache"  # Created next to the BVH files
+MOTION_CACHE_VERSION = 1  # Increase to invalidate existing caches
+
+
+def extract_ref_motion_data(fname, normalize=False, use_cache=True, cache_dir=None):
+    """
+    Extract motion data from the BVH reference file.
+
+    Parameters:
+        fname (str): Path to the BVH file.
+        normalize (bool): Return positions normalized with `normalize_skeleton`.
+        use_cache (bool): Memory-map the positions from the on-disk cache,
+                          creating it if needed, instead of parsing the BVH.
+        cache_dir (str): Cache directory, defaults to MOTION_CACHE_DIR next to the file.
 
+    Returns:
+        np.ndarray: Global joint positions of shape (n_frames, n_joints, 3). Cached
+                    arrays are read-only.
+    """
+    if not use_cache:
+        animation, _, _ = BVH.load(fname, fast=True)
+        global_position = positions_global(animation)
+        return normalize_skeleton(global_position) if normalize else global_position
+
+    motion = load_cached_motion_data(fname, cache_dir)
+    return motion["normalized_positions" if normalize else "positions"]
+
+
+def load_cached_motion_data(fname, cache_dir=None, **load_kwargs):
+    """
+    Load the motion of a BVH file from its binary cache, keyed by the content of
+    the file and the parameters given to `BVH.load`. The cache is built on the
+    first call.
+
+    Parameters:
+        fname (str): Path to the BVH file.
+        cache_dir (str): Cache directory, defaults to MOTION_CACHE_DIR next to the file.
+        **load_kwargs: Extra parameters for `BVH.load` (start, end, order, world).
 
-def extract_ref_motion_data(
-    fname,
-    normalize=False,
-):
-    """Extract motion data from the BVH reference file."""
-    animation, _, _ = BVH.load(fname)
+    Returns:
+        dict: "positions" and "normalized_positions" (memory-mapped, read-only),
+              "parents", "names" and "frametime".
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname)), MOTION_CACHE_DIR)
+    stem = os.path.splitext(os.path.basename(fname))[0]
+    entry = os.path.join(cache_dir, f"{stem}-{_motion_cache_key(fname, load_kwargs)}")
+
+    if not os.path.isdir(entry):
+        _write_motion_cache(fname, entry, load_kwargs)
+
+    with open(os.path.join(entry, "meta.json")) as f:
+        meta = json.load(f)
+    return {
+        "positions": np.load(os.path.join(entry, "positions.npy"), mmap_mode="r"),
+        "normalized_positions": np.load(
+            os.path.join(entry, "normalized_positions.npy"), mmap_mode="r"
+        ),
+        "parents": np.load(os.path.join(entry, "parents.npy")),
+        "names": meta["names"],
+        "frametime": meta["frametime"],
+    }
+
+
+def prune_motion_cache(fname, cache_dir=None, **load_kwargs):
+    """
+    Remove the cache entries of former versions of a BVH file, keeping the one
+    of its current content (see `load_cached_motion_data`).
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname)), MOTION_CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        return
+    stem = os.path.splitext(os.path.basename(fname))[0]
+    current = f"{stem}-{_motion_cache_key(fname, load_kwargs)}"
+    for name in os.listdir(cache_dir):
+        entry_stem, _, key = name.rpartition("-")
+        if entry_stem == stem and len(key) == 16 and name != current:
+            # Still memory-mapped by levels being scored, removal fails on Windows
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+def _motion_cache_key(fname, load_kwargs):
+    """Hash of the file content, loader parameters and cache version."""
+    digest = hashlib.sha1()
+    digest.update(
+        json.dumps([MOTION_CACHE_VERSION, sorted(load_kwargs.items())]).encode()
+    )
+    with open(fname, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _write_motion_cache(fname, entry, load_kwargs):
+    """Parse the BVH file and write its cache entry atomically."""
+    animation, names, frametime = BVH.load(fname, fast=True, **load_kwargs)
     global_position = positions_global(animation)
-    return global_position
+
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp_entry = tempfile.mkdtemp(dir=os.path.dirname(entry))
+    np.save(os.path.join(tmp_entry, "positions.npy"), global_position)
+    np.save(
+        os.path.join(tmp_entry, "normalized_positions.npy"),
+        normalize_skeleton(global_position),
+    )
+    np.save(os.path.join(tmp_entry, "parents.npy"), animation.parents)
+    with open(os.path.join(tmp_entry, "meta.json"), "w") as f:
+        json.dump({"names": names, "frametime": frametime}, f)
+
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:  # Written concurrently by another process
+        shutil.rmtree(tmp_entry, ignore_errors=True)
 
 
 def convert_angles_names_to_idx(angles):